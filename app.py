@@ -1,75 +1,140 @@
 import streamlit as st
-import pandas as pd
+import hashlib
+import time
+from datetime import date
 from pathlib import Path
 
 # 从各个模块导入所需的类和函数
-from config import setup_logging, NATIONAL_DIR_SQL_FILE
+from config import setup_logging, SCM_UPLOAD_CACHE_MAX_ENTRIES, JOB_POLL_SECONDS
 from ui.components import FileUploadWidget
+from ui.reporter import StreamlitReporter
 from db.database_handler import SQLProcessor
-from processing.data_mapper import MappingProcessor
+from db.engine import probe
+from db.query_cache import QueryCache
+from processing.data_mapper import MappingProcessor, MappingPlan
+from processing.enrichment import BaseDataEnricher
 from processing.data_merger import DataMerger
 from processing.data_processor import DataProcessor 
 from processing.data_formatter import DataFormatter 
 from processing.pipeline import AnalysisPipeline # <-- 核心改动：导入Pipeline
+from processing.column_schema import validate_mapping
 from utils.exporter import ResultExporter
 from utils.file_handler import FileProcessor
+from utils.jobs import Job, JobRunner
 from utils.persistence import PersistenceManager
 
 # 设置日志
 logger = setup_logging()
 
+@st.cache_resource
+def _shared_processors() -> dict:
+    """
+    构建进程内共享的处理器实例。
+    Streamlit 每次交互都会重新执行脚本，处理器本身不保存会话状态，只需构建一次。
+    """
+    reporter = StreamlitReporter()
+    sql_processor = SQLProcessor(reporter=reporter)
+    national_dir_cache = QueryCache("national_dir")
+    return {
+        "file": FileProcessor(),
+        "upload_widget": FileUploadWidget(),
+        "mapper": MappingProcessor(),
+        "sql": sql_processor,
+        "merger": DataMerger(),
+        "processor": DataProcessor(),
+        "formatter": DataFormatter(),
+        "exporter": ResultExporter(),
+        "persistence": PersistenceManager(),
+        "reporter": reporter,
+        "enricher": BaseDataEnricher(sql_processor, national_dir_cache, reporter),
+        "national_dir_cache": national_dir_cache,
+        "scm_upload_cache": QueryCache("scm_upload", max_entries=SCM_UPLOAD_CACHE_MAX_ENTRIES, persist=False),
+        "jobs": JobRunner(),
+    }
+
+
 class NewProductAnalysisApp:
     """新品分析应用主类"""
 
     def __init__(self):
-        """初始化应用，实例化所有处理器"""
-        self.file_processor = FileProcessor()
-        self.upload_widget = FileUploadWidget()
-        self.mapping_processor = MappingProcessor()
-        self.sql_processor = SQLProcessor()
-        self.data_merger = DataMerger()
-        self.data_processor = DataProcessor() 
-        self.data_formatter = DataFormatter() 
-        self.result_exporter = ResultExporter()
-        self.persistence_manager = PersistenceManager()
+        """初始化应用，复用进程内共享的处理器实例"""
+        processors = _shared_processors()
+        self.file_processor = processors["file"]
+        self.upload_widget = processors["upload_widget"]
+        self.mapping_processor = processors["mapper"]
+        self.sql_processor = processors["sql"]
+        self.data_merger = processors["merger"]
+        self.data_processor = processors["processor"]
+        self.data_formatter = processors["formatter"]
+        self.result_exporter = processors["exporter"]
+        self.persistence_manager = processors["persistence"]
+        self.national_dir_cache = processors["national_dir_cache"]
+        self.scm_upload_cache = processors["scm_upload_cache"]
+        self.reporter = processors["reporter"]
+        self.enricher = processors["enricher"]
+        self.job_runner = processors["jobs"]
 
     def _load_persisted_map(self):
         """在应用会话开始时尝试加载持久化的映射表"""
         if "map_df" not in st.session_state:
-            st.session_state["map_df"] = self.persistence_manager.load_dataframe("map_df.pkl")
+            st.session_state["map_df"] = self.persistence_manager.load_dataframe("map_df")
+            st.session_state["map_version"] = self.persistence_manager.current_version("map_df")
             if st.session_state["map_df"] is not None:
+                # 加载映射表时即编译映射计划，运行分析时直接复用
+                MappingPlan.for_mapping(st.session_state["map_df"])
                 st.session_state["map_source"] = "history"
             else:
                 st.session_state["map_source"] = None
     
-    def _enrich_base_data(self, scm_df: pd.DataFrame) -> pd.DataFrame:
+    @staticmethod
+    def _upload_digest(uploaded_file, state_key: str) -> str:
+        """
+        上传文件内容的 SHA-256。按上传控件给出的 (file_id, 文件大小) 缓存在会话中，
+        同一次上传只计算一次，轮询进度等重跑不会重复读取整个文件。
         """
-        对SCM数据进行基础信息关联，例如国家医保目录，这是所有模式都需要的。
+        upload_key = (uploaded_file.file_id, uploaded_file.size)
+        cached = st.session_state.get(state_key)
+        if cached is None or cached[0] != upload_key:
+            cached = (upload_key, hashlib.sha256(uploaded_file.getvalue()).hexdigest())
+            st.session_state[state_key] = cached
+        return cached[1]
+
+    def _load_scm_upload(self, scm_file):
         """
-        current_df = scm_df.copy()
+        读取并关联SCM上传文件。以文件内容的 SHA-256 作为指纹：
+        同一会话内指纹未变时不做任何处理；其他会话已处理过的相同文件直接复用结果。
+        已加载映射表时只读取映射表第二列与 SCM_KEY_COLUMNS 中的列。
+        """
+        content_hash = self._upload_digest(scm_file, "scm_upload_digest")
+        usecols = self.enricher.scm_columns(st.session_state.get("map_df"))
+        # 医保目录按天更新，关联结果最多复用到当天；读取的列随映射表变化
+        cache_key = self.scm_upload_cache.make_key(
+            content_hash, sorted(usecols) if usecols is not None else None, date.today().isoformat()
+        )
+        if st.session_state.get("scm_cache_key") == cache_key and st.session_state.get("scm_df") is not None:
+            return
 
-        # --- 关联国家医保目录 ---
-        try:
-            if NATIONAL_DIR_SQL_FILE.exists():
-                sql_query = self.sql_processor.read_sql_file(NATIONAL_DIR_SQL_FILE)
-                national_dir_df, _ = self.sql_processor.execute_simple_query(sql_query)
-                
-                if not national_dir_df.empty and '国家药品编码' in current_df.columns and '国家药品编码' in national_dir_df.columns:
-                    current_df['国家药品编码'] = current_df['国家药品编码'].astype(str)
-                    national_dir_df['国家药品编码'] = national_dir_df['国家药品编码'].astype(str)
-                    
-                    cols_to_replace = ['国家医保目录', '省医保目录', '省医保支付价']
-                    df_cleaned = current_df.drop(columns=[col for col in cols_to_replace if col in current_df.columns])
-                    
-                    current_df = pd.merge(df_cleaned, national_dir_df, on='国家药品编码', how='left')
-                else:
-                    st.warning("⚠️ 无法关联国家医保目录（缺少关联键或查询为空）。")
-            else:
-                st.warning(f"⚠️ 未找到 '{NATIONAL_DIR_SQL_FILE}' 文件，医保目录信息将不会关联。")
-        except Exception as e:
-            st.error(f"❌ 关联国家医保目录时出错: {e}")
+        base_enriched_scm_df = self.scm_upload_cache.get(cache_key)
+        if base_enriched_scm_df is None:
+            with st.spinner("正在读取新品数据..."):
+                scm_df = self.enricher.read_scm(scm_file, st.session_state.get("map_df"))
+                st.session_state["scm_parse_stats"] = scm_df.attrs.get('parse_stats')
+                base_enriched_scm_df = self.enricher.enrich(scm_df)
+                # 关联医保目录失败时不缓存，下次重跑时重试
+                if base_enriched_scm_df.attrs.get('national_dir_joined'):
+                    self.scm_upload_cache.put(cache_key, base_enriched_scm_df)
+        else:
+            logger.info(f"SCM文件 {content_hash[:16]} 已处理过，直接复用。")
+
+        st.session_state["scm_df"] = base_enriched_scm_df
+        st.session_state["scm_hash"] = content_hash
+        st.session_state["scm_cache_key"] = cache_key
 
-        return current_df
+    @staticmethod
+    def _render_parse_stats(parse_stats: dict):
+        """显示上传文件的解析格式、引擎与耗时。"""
+        if parse_stats:
+            st.caption(f"解析: {parse_stats['format']} ｜ 引擎: {parse_stats['engine']} ｜ 耗时: {parse_stats['seconds']} 秒")
 
     def _inject_custom_css(self):
         st.markdown(
@@ -268,6 +333,54 @@ class NewProductAnalysisApp:
             unsafe_allow_html=True,
         )
 
+    def render_sidebar(self):
+        """侧边栏：缓存管理等辅助操作"""
+        with st.sidebar:
+            st.subheader("缓存管理")
+            if st.button("🔄 刷新医保目录缓存", use_container_width=True):
+                self.national_dir_cache.clear()
+                # 已关联旧医保目录的上传文件也需重新关联；清除本会话的缓存键，当前上传在本次重跑中即重新关联
+                self.scm_upload_cache.clear()
+                st.session_state.pop("scm_cache_key", None)
+                st.success("医保目录缓存已清空，已上传的新品数据将按最新目录重新关联。")
+
+            self._render_map_versions()
+
+            st.subheader("数据库连接")
+            if st.button("📶 检测数据库连接", use_container_width=True):
+                health = probe(self.sql_processor.engine)
+                if health["ok"]:
+                    st.success(f"连接正常，往返延迟 {health['latency_ms']} ms")
+                else:
+                    st.error(f"数据库连接失败: {health['error']}")
+                st.caption(f"连接池状态: {health['pool']}")
+
+    def _render_map_versions(self):
+        """侧边栏中的映射表历史版本列表，可一键回滚到任一保留的版本。"""
+        versions = self.persistence_manager.list_versions("map_df")
+        if not versions:
+            return
+
+        st.subheader("映射表版本")
+        current = self.persistence_manager.current_version("map_df")
+        labels = {
+            entry["version"]: (
+                f"v{entry['version']} · {entry['saved_at'].replace('T', ' ')} · "
+                f"{entry.get('source_name') or '未知文件'} · {entry['rows']} 行"
+                + (" (当前)" if entry["version"] == current else "")
+            )
+            for entry in versions
+        }
+        selected = st.selectbox("历史版本", list(labels), format_func=labels.get, label_visibility="collapsed")
+        if st.button("↩️ 回滚到此版本", use_container_width=True, disabled=selected == current):
+            map_df = self.persistence_manager.load_dataframe("map_df", version=selected)
+            if map_df is not None and self.persistence_manager.set_current_version("map_df", selected):
+                MappingPlan.for_mapping(map_df)
+                st.session_state["map_df"] = map_df
+                st.session_state["map_source"] = "history"
+                st.session_state["map_version"] = selected
+                st.rerun()
+
     def render_header(self):
         st.set_page_config(page_title="新品过会分析表生成工具", layout="wide")
         st.title("新品过会分析表生成工具")
@@ -277,6 +390,8 @@ class NewProductAnalysisApp:
         st.markdown('<div class="card">', unsafe_allow_html=True)
         st.markdown('<div class="card-title">① 数据上传</div>', unsafe_allow_html=True)
         col1, col2 = st.columns(2)
+        # 后台任务运行期间页面每隔 JOB_POLL_SECONDS 重跑一次，此时上传控件照常显示，但不重新处理上传与校验映射表
+        running = st.session_state.get("is_running", False)
         
         with col1:
             tooltip_text = "已自动加载历史映射表。您可以上传新文件进行覆盖。" if st.session_state.get("map_source") == "history" else "您上传的映射表将被自动保存，供下次使用。"
@@ -296,13 +411,22 @@ class NewProductAnalysisApp:
             """)
             
             map_file = st.file_uploader("上传映射关系表", type=["xlsx", "xls"], key="map_uploader_new", label_visibility="collapsed")
-            if map_file:
+            map_hash = self._upload_digest(map_file, "map_upload_digest") if map_file and not running else None
+            # 同一文件只在首次上传时读取并保存，之后的重跑直接沿用
+            if running:
+                pass
+            elif map_file and map_hash != st.session_state.get("map_hash"):
                 with st.spinner("正在读取并保存新映射表..."):
-                    new_map_df = self.file_processor.read_excel_safe(map_file)
+                    new_map_df = MappingPlan.tag(self.file_processor.read_excel_safe(map_file), map_hash)
+                    MappingPlan.for_mapping(new_map_df)
+                    st.session_state["map_parse_stats"] = new_map_df.attrs.get('parse_stats')
                     st.session_state["map_df"] = new_map_df
                     st.session_state["map_source"] = "upload"
-                    self.persistence_manager.save_dataframe(new_map_df, "map_df.pkl")
-            elif not st.session_state.get("map_df_from_upload"):
+                    st.session_state["map_hash"] = map_hash
+                    st.session_state["map_version"] = self.persistence_manager.save_dataframe(
+                        new_map_df, "map_df", source_name=map_file.name, content_hash=map_hash
+                    )
+            elif not map_file and not st.session_state.get("map_df_from_upload"):
                  st.session_state["map_source"] = "history" if "map_df" in st.session_state and st.session_state["map_df"] is not None else None
 
 
@@ -316,25 +440,44 @@ class NewProductAnalysisApp:
             """)
 
             scm_file = st.file_uploader("上传新品申报数据", type=["xlsx", "xls"], key="scm_uploader_new", label_visibility="collapsed")
-            if scm_file:
-                with st.spinner("正在读取新品数据..."):
-                    dtype_spec = {'过会编码': str, '新品编码': str, '商品编码': str, '国际条码': str, '国家药品编码': str}
-                    scm_df = self.file_processor.read_excel_safe(scm_file, dtype_spec=dtype_spec)
-                    base_enriched_scm_df = self._enrich_base_data(scm_df)
-                    st.session_state["scm_df"] = base_enriched_scm_df
+            if running:
+                pass
+            elif scm_file:
+                self._load_scm_upload(scm_file)
             else:
                 if "scm_df" in st.session_state:
                     st.session_state["scm_df"] = None
+                    st.session_state["scm_hash"] = None
+                    st.session_state["scm_cache_key"] = None
 
         if st.session_state.get("map_df") is not None:
             df = st.session_state["map_df"]
             source_text = "历史记录" if st.session_state.get("map_source") == "history" else "新上传"
             st.success(f"✅ 映射关系表已加载 ({source_text} - {df.shape[0]} 行, {df.shape[1]} 列)")
+            if st.session_state.get("map_source") == "upload":
+                self._render_parse_stats(st.session_state.get("map_parse_stats"))
+            if not running:
+                scm_df = st.session_state.get("scm_df")
+                # 提报战区 由地采策略按采购公司关联补齐，不要求出现在上传的数据中
+                scm_columns = scm_df.columns.union(['提报战区']) if scm_df is not None else None
+                st.session_state["mapping_issues"] = validate_mapping(df, scm_columns)
+            mapping_issues = st.session_state.get("mapping_issues")
+            if mapping_issues:
+                with st.expander(f"⚠️ 映射表校验发现 {len(mapping_issues)} 项提示"):
+                    for issue in mapping_issues:
+                        st.warning(issue)
         
         if st.session_state.get("scm_df") is not None:
             df = st.session_state["scm_df"]
-            purchase_mode = df['采购模式'].dropna().iloc[0] if '采购模式' in df.columns and not df['采购模式'].dropna().empty else "未知"
+            if '采购模式' in df.columns and not df['采购模式'].dropna().empty:
+                parts = AnalysisPipeline.partition(df)
+                purchase_mode = "，".join(f"{mode} {len(part)} 行" for mode, part in parts.items()) if len(parts) > 1 else next(iter(parts))
+            else:
+                purchase_mode = "未知"
             st.success(f"✅ 新品申报数据已加载 ({df.shape[0]} 行, {df.shape[1]} 列) - **检测到采购模式:【{purchase_mode}】**")
+            if st.session_state.get("scm_hash"):
+                st.caption(f"文件指纹 (SHA-256): `{st.session_state['scm_hash'][:16]}`")
+            self._render_parse_stats(st.session_state.get("scm_parse_stats"))
             
         st.markdown('</div>', unsafe_allow_html=True)
 
@@ -347,66 +490,100 @@ class NewProductAnalysisApp:
                 if st.session_state.get("map_df") is None or st.session_state.get("scm_df") is None:
                     st.error("❌ 请先上传映射关系表和新品申报数据！")
                 else:
-                    st.session_state.is_running = True
+                    self._submit_analysis()
                     st.rerun()
         else:
             if st.button("中止运行", type="secondary", use_container_width=True):
-                st.session_state.is_running = False
-                st.warning("操作已中止。")
-                if "result_df" in st.session_state:
-                    del st.session_state["result_df"]
+                # 协作式取消：任务在下一个阶段切换或合并/导出循环的检查点停止，结束后由轮询显示结果
+                self.job_runner.cancel(st.session_state.get("job_id"))
+                st.session_state["job_cancel_requested"] = True
                 st.rerun()
 
+        notice = st.session_state.pop("job_notice", None)
+        if notice:
+            level, message = notice
+            getattr(st, level)(message)
+
         st.markdown('</div>', unsafe_allow_html=True)
 
-    def _process_analysis(self):
+    def _submit_analysis(self):
         """
-        核心处理流程 - 重构后
-        该函数现在只负责调度，不关心具体实现。
+        把分析流程提交为后台任务，页面只轮询进度，不阻塞会话。
+        任务在后台线程中运行，不能调用 st.*：提示信息记录在任务自己的 Reporter 中，由页面轮询时显示。
         """
-        try:
-            map_df = st.session_state.get("map_df")
-            scm_df = st.session_state.get("scm_df")
-
-            status = st.status("准备开始生成…", expanded=True)
-            
-            # 动态更新状态的回调函数
-            def update_status(label, state):
-                if not st.session_state.get("is_running", False):
-                    raise InterruptedError("用户中止了操作。")
-                status.update(label=label, state=state)
-
-            # 确定采购模式
-            purchase_mode = scm_df['采购模式'].dropna().iloc[0] if '采购模式' in scm_df.columns and not scm_df['采购模式'].dropna().empty else "地采"
-            
-            # 准备所有处理器
-            processors = {
-                "sql": self.sql_processor,
-                "mapper": self.mapping_processor,
-                "merger": self.data_merger,
-                "processor": self.data_processor,
-                "formatter": self.data_formatter,
-                "exporter": self.result_exporter,
-                "status_updater": update_status
+        map_df = st.session_state["map_df"].copy()
+        scm_df = st.session_state["scm_df"].copy()
+        processors = {
+            "mapper": self.mapping_processor,
+            "merger": self.data_merger,
+            "processor": self.data_processor,
+            "formatter": self.data_formatter,
+            "exporter": self.result_exporter,
+        }
+
+        def run_analysis(job: Job) -> dict:
+            job_processors = {
+                **processors,
+                # 查询缓存与增量存储在进程内共享，按任务构建只是为了让查询提示进入任务的 Reporter
+                "sql": SQLProcessor(reporter=job.reporter),
+                "reporter": job.reporter,
+                "status_updater": job.progress.update_status,
+                "progress": job.progress,
             }
-            
-            # 初始化并运行Pipeline
-            pipeline = AnalysisPipeline(purchase_mode=purchase_mode, processors=processors)
-            result = pipeline.run(map_df.copy(), scm_df.copy())
-            
-            # 保存结果
-            for key, value in result.items():
-                st.session_state[key] = value
-            
-            status.update(label="🎉 生成完成！", state="complete")
-
-        except InterruptedError as e:
-            st.warning(f"操作已由用户中止。")
-        except Exception as e:
-            st.error(f"❌ 分析过程中发生错误: {e}")
-            logger.error(f"分析处理错误: {e}", exc_info=True)
-        finally:
+            # 按每行的采购模式分别处理，混合时导出为两个工作表
+            pipeline = AnalysisPipeline(purchase_mode=None, processors=job_processors)
+            return pipeline.run(map_df, scm_df)
+
+        job = self.job_runner.submit(f"新品分析（{len(scm_df)} 行）", run_analysis)
+        st.session_state["job_id"] = job.id
+        st.session_state["job_cancel_requested"] = False
+        st.session_state.is_running = True
+
+    @staticmethod
+    def _render_job_messages(messages: list):
+        """显示任务记录的提示：info（如命中查询缓存）为状态面板中的普通文字，警告与错误用提示框。"""
+        for level, message in messages:
+            if level == "info":
+                st.write(message)
+            else:
+                getattr(st, level)(message)
+
+    def _poll_analysis(self):
+        """显示后台任务的进度；任务未结束时稍后重跑页面继续轮询，结束后保存结果。"""
+        job = self.job_runner.get(st.session_state.get("job_id"))
+        if job is None:
             st.session_state.is_running = False
+            return
+
+        snapshot = job.progress.snapshot()
+        stage = "正在中止…" if st.session_state.get("job_cancel_requested") else snapshot["stage"]
+        with st.status(stage, expanded=True):
+            for name, (done, total) in snapshot["counters"].items():
+                st.progress(done / total if total else 1.0, text=f"{name}：{done} / {total}")
+            # 命中缓存等提示经任务的 Reporter 记录（阶段标签会被下一阶段覆盖，不能承载提示）
+            self._render_job_messages(job.reporter.messages)
+
+        if not job.finished:
+            time.sleep(JOB_POLL_SECONDS)
+            st.rerun()
+
+        st.session_state.is_running = False
+        st.session_state.pop("job_id", None)
+        if job.state == 'done':
+            # 清除上次混合采购模式运行留下的分表结果
+            for key in ("result_sheets", "purchase_modes"):
+                st.session_state.pop(key, None)
+            for key, value in job.result.items():
+                st.session_state[key] = value
+            st.session_state["run_messages"] = list(job.reporter.messages)
+        else:
+            if "result_df" in st.session_state:
+                del st.session_state["result_df"]
+            if job.state == 'cancelled':
+                st.session_state["job_notice"] = ("warning", "操作已由用户中止。")
+            else:
+                st.session_state["job_notice"] = ("error", f"❌ 分析过程中发生错误: {job.error}")
+        st.rerun()
 
     def render_results_section(self):
         """③ 分析结果区域"""
@@ -427,6 +604,15 @@ class NewProductAnalysisApp:
             st.metric("总计行数", result_df.shape[0])
         with col3:
             st.metric("总计列数", result_df.shape[1])
+
+        run_messages = st.session_state.get("run_messages")
+        if run_messages:
+            with st.expander(f"运行提示（{len(run_messages)} 条）"):
+                self._render_job_messages(run_messages)
+
+        export_stats = st.session_state.get("export_stats")
+        if export_stats:
+            st.caption(f"导出引擎: {export_stats['engine']} ｜ 命名样式: {export_stats['named_styles']} 个 ｜ 导出耗时: {export_stats['seconds']} 秒")
             
         st.download_button(
             label="📥 下载Excel结果文件",
@@ -436,8 +622,14 @@ class NewProductAnalysisApp:
             use_container_width=True,
         )
         
+        result_sheets = st.session_state.get("result_sheets")
         with st.expander("点击预览结果数据"):
-            st.dataframe(st.session_state["result_df"])
+            if result_sheets:
+                for tab, (mode, sheet_df) in zip(st.tabs(list(result_sheets)), result_sheets.items()):
+                    with tab:
+                        st.dataframe(sheet_df)
+            else:
+                st.dataframe(st.session_state["result_df"])
         
         if "executed_sql" in st.session_state:
             with st.expander("点击查看对标品SQL"):
@@ -453,12 +645,12 @@ class NewProductAnalysisApp:
         self.render_header()
         self._inject_custom_css()
         self._load_persisted_map()
+        self.render_sidebar()
         self.render_input_section()
         self.render_action_section()
 
         if st.session_state.is_running:
-            self._process_analysis()
-            st.rerun()
+            self._poll_analysis()
             
         self.render_results_section()
 
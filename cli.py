@@ -0,0 +1,78 @@
+"""
+新品分析的命令行批处理入口（无需 Streamlit）。
+
+用法:
+    python cli.py --map 映射关系表.xlsx --scm 导出目录/ [--scm "其他/*.xlsx" ...] --out 输出目录/ [--workers 4]
+
+每份SCM文件生成一个Excel结果文件，输出目录中另有 run_summary.json 记录各文件的处理结果与提示信息。
+"""
+
+import argparse
+import glob
+import sys
+from pathlib import Path
+from typing import Iterable, List
+from config import setup_logging, BATCH_WORKERS
+from db.database_handler import SQLProcessor
+from db.query_cache import QueryCache
+from processing.batch import BatchRunner
+from processing.data_formatter import DataFormatter
+from processing.data_mapper import MappingProcessor, MappingPlan
+from processing.data_merger import DataMerger
+from processing.data_processor import DataProcessor
+from processing.enrichment import BaseDataEnricher
+from utils.exporter import ResultExporter
+from utils.file_handler import FileProcessor
+from utils.reporter import Reporter
+
+logger = setup_logging()
+
+EXCEL_SUFFIXES = ('.xlsx', '.xls')
+
+
+def resolve_inputs(patterns: Iterable[str]) -> List[Path]:
+    """把目录或通配符展开为Excel文件列表（去重、保持顺序，忽略 Excel 的 ~$ 临时文件）。"""
+    paths = []
+    for pattern in patterns:
+        if Path(pattern).is_dir():
+            matches = sorted(path for path in Path(pattern).iterdir() if path.suffix.lower() in EXCEL_SUFFIXES)
+        else:
+            matches = sorted(Path(match) for match in glob.glob(pattern))
+        paths.extend(path for path in matches if path.is_file() and not path.name.startswith('~$'))
+    return list(dict.fromkeys(paths))
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="批量生成新品过会分析表")
+    parser.add_argument("--map", required=True, type=Path, help="映射关系表 (Excel)")
+    parser.add_argument("--scm", required=True, action="append", help="SCM导出文件所在目录或通配符，可重复指定")
+    parser.add_argument("--out", default=Path("output"), type=Path, help="结果输出目录 (默认: output)")
+    parser.add_argument("--workers", default=BATCH_WORKERS, type=int, help=f"并行处理的进程数，1 表示逐个处理 (默认: {BATCH_WORKERS})")
+    args = parser.parse_args(argv)
+
+    scm_paths = resolve_inputs(args.scm)
+    if args.workers < 1:
+        parser.error("--workers 必须是正整数")
+    if not scm_paths:
+        parser.error("没有找到任何SCM文件")
+
+    map_df = FileProcessor.read_excel_safe(args.map)
+    MappingPlan.for_mapping(map_df)
+
+    reporter = Reporter()
+    sql_processor = SQLProcessor(reporter=reporter)
+    processors = {
+        "sql": sql_processor,
+        "mapper": MappingProcessor(),
+        "merger": DataMerger(),
+        "processor": DataProcessor(),
+        "formatter": DataFormatter(),
+        "exporter": ResultExporter(),
+    }
+    enricher = BaseDataEnricher(sql_processor, QueryCache("national_dir"), reporter)
+    summary = BatchRunner(processors, enricher, reporter, workers=args.workers).run(map_df, scm_paths, args.out)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
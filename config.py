@@ -1,4 +1,5 @@
 import logging
+import os
 import warnings
 from pathlib import Path
 
@@ -9,9 +10,74 @@ DB_PORT = 3306
 DB_USER = "xinpin"
 DB_PASSWORD = "xinpin"
 DB_NAME = "new_goods_manage"
+# --- 数据库连接池 (Connection Pool) ---
+# 进程内所有会话共享一个连接池；SQL_QUERY_WORKERS 不应超过 DB_POOL_SIZE + DB_MAX_OVERFLOW
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 5
+DB_POOL_TIMEOUT = 30          # 等待空闲连接的秒数
+DB_POOL_RECYCLE = 1800        # 连接最长复用秒数，避免被服务端 wait_timeout 断开
+DB_POOL_PRE_PING = True       # 取出连接前先检测连接是否可用
+DB_POOL_WARM_CONNECTIONS = 2  # 进程启动时预先建立的连接数
 DEFAULT_SQL_FILE = Path("对标品.sql")
 NATIONAL_DIR_SQL_FILE = Path("医保目录.sql")
 PURCHASE_CO_MAPPING_FILE = Path("采购公司与提报战区映射表(名称).xlsx") # <-- 新增：采购公司映射文件名
+CACHE_DIR = Path(".cache")
+# 映射表持久化时保留的历史版本数
+PERSIST_MAX_VERSIONS = 5
+# SCM数据中除映射表第二列外，后续流程还会用到的列（读取SCM文件时只解析这些列）
+SCM_KEY_COLUMNS = ['采购模式', '通用名', '策略分类', '三级大类', '采购公司', '提报战区', '国家药品编码']
+
+# --- 查询缓存 (Query Cache) ---
+NATIONAL_DIR_TABLE = "scm_xp_med_insu_cata_dfp"
+# 医保目录每天最多更新一次；有效期内直接使用缓存，不再探测数据版本
+NATIONAL_DIR_CACHE_TTL = 24 * 60 * 60
+# 按内容指纹复用已读取并关联医保目录的SCM上传文件（仅进程内），最多保留的文件数
+SCM_UPLOAD_CACHE_MAX_ENTRIES = 16
+BENCHMARK_TABLE = "new_product_review_all_allindex_v2_dfp"
+# 对标品查询结果缓存：按最近最少使用淘汰，限制条目数与磁盘占用
+BENCHMARK_CACHE_MAX_ENTRIES = 20
+BENCHMARK_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# 对标品增量存储（同一分区日期内复用已取回的行）最多保留的行数
+BENCHMARK_STORE_MAX_ROWS = 2_000_000
+
+# --- 对标品查询 (Benchmark Query) ---
+# 单条查询中每个 IN 列表最多包含的值数量，超出时拆分为多条查询
+SQL_IN_CHUNK_SIZE = 500
+# 拆分后的查询并发执行的最大线程数（不超过连接池大小）
+SQL_QUERY_WORKERS = 4
+# 是否把对标品SQL的SELECT列表裁剪为映射表实际用到的列
+BENCHMARK_COLUMN_PROJECTION = True
+# 'buffered' 一次性读入查询结果，可使用查询缓存与增量存储；
+# 'streaming' 使用服务端游标分块读取，逐块完成映射与三级大类预筛选，内存占用只与筛选后的结果相关（不使用缓存）
+BENCHMARK_FETCH_MODE = "buffered"
+# 流式读取时每块的行数
+BENCHMARK_FETCH_CHUNK_SIZE = 50_000
+
+# --- 命令行批处理 (Batch) ---
+# 并行处理SCM文件的进程数（默认不超过CPU核数）；1 表示在当前进程中逐个处理
+BATCH_WORKERS = min(4, os.cpu_count() or 1)
+
+# --- 后台任务 (Background Jobs) ---
+# 网页端同时运行的分析任务数（各会话共享）
+JOB_WORKERS = 2
+# 最多保留的已结束任务数，超出后丢弃最早结束的任务
+JOB_HISTORY_MAX = 20
+# 页面轮询任务进度的间隔秒数
+JOB_POLL_SECONDS = 0.5
+# 合并与导出循环中每处理多少行更新一次进度并检查任务是否已取消
+PROGRESS_INTERVAL_ROWS = 200
+
+# --- 处理引擎开关 (Engine Switches) ---
+# 'grouped' 为预分组的向量化合并引擎；'legacy' 为逐行遍历的旧实现，仅用于结果核对
+MERGE_ENGINE = "grouped"
+# 'streaming' 为只写模式、单次遍历的导出引擎；'openpyxl' 为先整表写入再逐格设置样式的旧实现
+EXPORT_ENGINE = "streaming"
+# 读取上传的Excel：'auto' 在安装了 python-calamine 时优先使用 calamine，否则按文件格式选择 openpyxl/xlrd；
+# 'calamine' 要求使用 calamine（未安装时退回默认引擎并记录警告）；'default' 只使用 openpyxl/xlrd
+EXCEL_READ_ENGINE = "auto"
+# 'categorical' 把三级大类、通用名、战区等关联/分组键列在读入后转换为分类类型，SCM与对标品共用类别字典；
+# 'object' 保持为字符串对象列
+KEY_DTYPE_MODE = "categorical"
 
 def setup_logging():
     """配置日志记录器"""
@@ -0,0 +1,129 @@
+"""
+对标品行的内存索引：一次取回多个任务筛选条件并集的对标品行后，
+按 通用名 → 战区 → 三级大类 与 策略分类 → 战区 → 三级大类 的嵌套字典保存行号，
+各任务只按自己请求的键逐层查找对应分组，查询开销只与请求的键数和命中的行数有关，与索引总行数无关。
+"""
+
+from typing import Callable, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from config import setup_logging, SQL_IN_CHUNK_SIZE, BENCHMARK_COLUMN_PROJECTION
+from db.benchmark_store import NAME_COLUMN, ZONE_COLUMN, CATEGORY_COLUMN
+from db.database_handler import PROJECTION_KEEP_COLUMNS
+from db.query_builder import BenchmarkQueryBuilder, filter_zones, project_select
+from utils.reporter import Reporter
+from utils.resource_cache import load_cached, read_text
+
+logger = setup_logging()
+
+
+def _keys(source, column: Optional[str]) -> np.ndarray:
+    """列值按字符串比较（空值为 None）；column 为 None 或不存在时全部为 None。"""
+    if isinstance(source, pa.Table):
+        if column is None or column not in source.column_names:
+            return np.full(source.num_rows, None, dtype=object)
+        return pc.cast(source[column], pa.string()).to_numpy(zero_copy_only=False).astype(object)
+    if column is None or column not in source.columns:
+        return np.full(len(source), None, dtype=object)
+    series = source[column]
+    return np.where(series.isna(), None, series.astype(str)).astype(object)
+
+
+class BenchmarkIndex:
+    """按 (战区, 三级大类, 通用名/策略分类) 分组的对标品行索引；数据源为 DataFrame 或（内存映射的）Arrow 表。"""
+
+    def __init__(self, source, lev3_column: Optional[str] = None):
+        """
+        Args:
+            source (pd.DataFrame | pa.Table): 对标品行（映射前的查询结果列名）。
+            lev3_column (str): 映射后成为 三级大类 的源列；None 表示不按三级大类分组。
+        """
+        self.source = source
+        zones, lev3 = _keys(source, ZONE_COLUMN), _keys(source, lev3_column)
+        self._by_name = self._group(zones, lev3, _keys(source, NAME_COLUMN))
+        self._by_category = self._group(zones, lev3, _keys(source, CATEGORY_COLUMN))
+        logger.info(f"对标品索引已建立：{len(zones)} 行，{len(self._by_name)} 个通用名、{len(self._by_category)} 个策略分类。")
+
+    @staticmethod
+    def _group(zones: np.ndarray, lev3: np.ndarray, values: np.ndarray) -> dict:
+        """{值: {战区: {三级大类: 行号数组}}}，行号按原顺序排列；值或战区为空的行不会被查询到，不收录。"""
+        frame = pd.DataFrame({"value": values, "zone": zones, "lev3": lev3})
+        nested = {}
+        for (value, zone, lev3_value), rows in frame.groupby(["value", "zone", "lev3"], dropna=False, sort=False).indices.items():
+            if value is None or zone is None or pd.isna(value) or pd.isna(zone):
+                continue
+            # 三级大类为空统一记为 None
+            nested.setdefault(value, {}).setdefault(zone, {})[None if pd.isna(lev3_value) else lev3_value] = rows
+        return nested
+
+    def positions(self, names: Iterable[str], categories: Iterable[str], zones: Iterable[str], lev3_categories: Iterable[str] = None) -> np.ndarray:
+        """
+        满足 (通用名 IN names OR 策略分类 IN categories) AND 战区 IN zones 的行号（按原顺序）。
+        传入 lev3_categories 时只保留三级大类在其中的行（合并时其余行不会被用到）。
+        """
+        zones = set(map(str, zones))
+        lev3_set = None if lev3_categories is None else set(map(str, lev3_categories))
+        picked = []
+        for groups, wanted in ((self._by_name, names), (self._by_category, categories)):
+            for value in set(map(str, wanted)):
+                by_zone = groups.get(value)
+                if by_zone is None:
+                    continue
+                for zone in zones:
+                    by_lev3 = by_zone.get(zone)
+                    if by_lev3 is None:
+                        continue
+                    if lev3_set is None:
+                        picked.extend(by_lev3.values())
+                    else:
+                        picked.extend(by_lev3[lev3] for lev3 in lev3_set if lev3 in by_lev3)
+        if not picked:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(picked))
+
+    def take(self, positions: np.ndarray) -> pd.DataFrame:
+        if isinstance(self.source, pa.Table):
+            return self.source.take(pa.array(positions, pa.int64())).to_pandas()
+        return self.source.take(positions).reset_index(drop=True)
+
+
+class IndexedSQLProcessor:
+    """
+    与 SQLProcessor 的对标品查询接口一致，结果从 BenchmarkIndex 中取出。
+    索引须覆盖查询条件（由调用方保证），且只支持按战区筛选的查询。
+    """
+
+    def __init__(self, index: BenchmarkIndex, lev3_categories: Iterable[str] = None, reporter: Reporter = None):
+        """
+        Args:
+            index (BenchmarkIndex): 对标品行索引。
+            lev3_categories (Iterable[str]): 任务SCM数据中的三级大类，只取这些三级大类的对标品行；None 表示不限。
+            reporter (Reporter): 提示信息的出口。
+        """
+        self.index = index
+        self.lev3_categories = None if lev3_categories is None else list(lev3_categories)
+        self.reporter = reporter or Reporter()
+
+    @staticmethod
+    def read_sql_file(file_path) -> str:
+        return load_cached(file_path, read_text)
+
+    def execute_sql_query(self, sql_query: str, cgms: str = None, common_names: List[str] = None, strategy_categories: List[str] = None, lev3_org_name: List[str] = None, use_cache: bool = True, columns: List[str] = None, chunk_transform: Callable[[pd.DataFrame], pd.DataFrame] = None) -> Tuple[pd.DataFrame, str]:
+        """按查询条件从索引中取出对标品行；chunk_transform 对结果整体执行一次。"""
+        if columns is not None and BENCHMARK_COLUMN_PROJECTION:
+            sql_query = project_select(sql_query, [*columns, *PROJECTION_KEEP_COLUMNS])
+        names = [str(name) for name in common_names or []]
+        categories = [str(category) for category in strategy_categories or []]
+        zones = filter_zones(cgms, lev3_org_name)
+        final_sql = BenchmarkQueryBuilder(sql_query, SQL_IN_CHUNK_SIZE).render(names, categories, zones)
+        if not zones or not (names or categories):
+            raise ValueError("对标品索引只支持按战区及通用名/策略分类筛选的查询")
+
+        df = self.index.take(self.index.positions(names, categories, zones, self.lev3_categories))
+        rows_selected = len(df)
+        if chunk_transform is not None:
+            df = chunk_transform(df)
+        df.attrs['query_stats'] = {"cache_hit": False, "indexed": True, "rows_selected": rows_selected}
+        return df, final_sql
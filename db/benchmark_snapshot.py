@@ -0,0 +1,46 @@
+"""
+对标品数据的只读快照，供批处理的工作进程使用。
+主进程把按所有文件筛选条件的并集取回的对标品行写成一个不压缩的 Arrow(Feather) 文件，
+各工作进程以内存映射方式打开并建立 BenchmarkIndex，按各自的条件在本地取出对应分组：
+不再访问数据库，整张表也不需要序列化后逐个传给工作进程（只有索引键列会被读入内存）。
+"""
+
+from pathlib import Path
+from typing import Iterable, Optional
+import pandas as pd
+from config import setup_logging
+from db.benchmark_index import BenchmarkIndex, IndexedSQLProcessor
+from utils.arrow_io import read_table, write_feather
+from utils.reporter import Reporter
+
+logger = setup_logging()
+
+# 每个进程内已打开的快照索引 {(文件路径, 三级大类源列): BenchmarkIndex}
+_INDEXES = {}
+
+
+def _open(snapshot_path: Path, lev3_column: Optional[str]) -> BenchmarkIndex:
+    key = (str(snapshot_path), lev3_column)
+    if key not in _INDEXES:
+        _INDEXES[key] = BenchmarkIndex(read_table(snapshot_path), lev3_column)
+    return _INDEXES[key]
+
+
+class SnapshotSQLProcessor(IndexedSQLProcessor):
+    """与 SQLProcessor 的对标品查询接口一致，但数据取自只读快照文件（索引在每个进程内只建立一次）。"""
+
+    def __init__(self, snapshot_path: Path, lev3_column: str = None, lev3_categories: Iterable[str] = None, reporter: Reporter = None):
+        """
+        Args:
+            snapshot_path (Path): 快照文件路径。
+            lev3_column (str): 映射后成为 三级大类 的源列，见 BenchmarkIndex。
+            lev3_categories (Iterable[str]): 任务SCM数据中的三级大类，见 IndexedSQLProcessor。
+            reporter (Reporter): 提示信息的出口。
+        """
+        super().__init__(_open(Path(snapshot_path), lev3_column), lev3_categories, reporter)
+
+    @staticmethod
+    def write(df: pd.DataFrame, snapshot_path: Path):
+        """把对标品行写为快照文件。"""
+        write_feather(df, snapshot_path)
+        logger.info(f"对标品快照已写入 {snapshot_path}（{len(df)} 行）。")
@@ -0,0 +1,142 @@
+"""
+对标品数据的增量存储：按 (SQL文本, 分区日期) 保存已经从数据库取回的对标品行，
+并记录每个战区已覆盖的通用名与策略分类。
+新的查询只需补充尚未覆盖的部分，其余行直接从本地存储中按条件筛选。
+存储为模块级对象，Streamlit 的每次重跑和每个会话共享同一份；分区日期变化时整体失效。
+"""
+
+import threading
+from typing import Iterable, List, Optional, Set, Tuple
+import pandas as pd
+from config import setup_logging
+
+logger = setup_logging()
+
+# 对标品.sql 中用于本地筛选的输出列（与 SQL 中的筛选字段一一对应）
+ZONE_COLUMN = '取数维度（战区/集团）'      # lev3_org_name
+NAME_COLUMN = '通用名'                    # goods_common_name
+CATEGORY_COLUMN = '三级策略分类'           # strategy_classify_name
+
+# {SQL键: _Snapshot}
+_SNAPSHOTS = {}
+_LOCK = threading.Lock()
+
+
+class _Snapshot:
+    """某个 SQL 在某个分区日期下已取回的数据及其覆盖范围。"""
+
+    def __init__(self, version: str):
+        self.version = version
+        self.frames: List[pd.DataFrame] = []
+        self.rows = 0
+        # {战区: (已覆盖的通用名集合, 已覆盖的策略分类集合)}
+        self.coverage = {}
+
+    def covered(self, zone: str) -> Tuple[Set[str], Set[str]]:
+        return self.coverage.setdefault(zone, (set(), set()))
+
+
+class BenchmarkStore:
+    """对标品行的增量存储，查询条件为 (通用名 IN … OR 策略分类 IN …) AND 战区 IN …。"""
+
+    def __init__(self, max_rows: Optional[int] = None):
+        """
+        Args:
+            max_rows (int): 单个快照最多保留的行数，超出后在下一次查询前清空、重新累积；None 表示不限制。
+        """
+        self.max_rows = max_rows
+
+    @staticmethod
+    def supports(sql_query: str) -> bool:
+        """SQL 输出了本地筛选所需的列时才能使用增量存储。"""
+        return all(f"`{column}`" in sql_query for column in (ZONE_COLUMN, NAME_COLUMN, CATEGORY_COLUMN))
+
+    @staticmethod
+    def _snapshot(sql_key: str, version: str) -> _Snapshot:
+        """返回当前分区日期的快照，分区日期变化时丢弃旧数据（调用方需持有锁）。"""
+        snapshot = _SNAPSHOTS.get(sql_key)
+        if snapshot is None or snapshot.version != version:
+            snapshot = _Snapshot(version)
+            _SNAPSHOTS[sql_key] = snapshot
+        return snapshot
+
+    def missing(self, sql_key: str, version: str, names: Iterable[str], categories: Iterable[str], zones: Iterable[str]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        计算尚未覆盖、需要补充查询的部分。
+
+        Returns:
+            Tuple[List[str], List[str], List[str]]: 需查询的通用名、策略分类和战区；三者均为空表示无需查询。
+        """
+        names, categories = set(names), set(categories)
+        missing_names, missing_categories, fetch_zones = set(), set(), []
+        with _LOCK:
+            snapshot = self._snapshot(sql_key, version)
+            if self.max_rows is not None and snapshot.rows > self.max_rows:
+                logger.info(f"对标品增量存储超过 {self.max_rows} 行，已清空后重新累积。")
+                snapshot = _Snapshot(version)
+                _SNAPSHOTS[sql_key] = snapshot
+            for zone in sorted(set(zones)):
+                covered_names, covered_categories = snapshot.covered(zone)
+                zone_names = names - covered_names
+                zone_categories = categories - covered_categories
+                if zone_names or zone_categories:
+                    missing_names |= zone_names
+                    missing_categories |= zone_categories
+                    fetch_zones.append(zone)
+        return sorted(missing_names), sorted(missing_categories), fetch_zones
+
+    def add(self, sql_key: str, version: str, df: pd.DataFrame, names: Iterable[str], categories: Iterable[str], zones: Iterable[str]):
+        """
+        并入一次补充查询的结果，并把 (通用名, 策略分类) 记为在这些战区已覆盖。
+        已在存储中的行（战区已覆盖其通用名或策略分类）不会重复并入。
+        """
+        names, categories = set(names), set(categories)
+        with _LOCK:
+            snapshot = self._snapshot(sql_key, version)
+            if not df.empty:
+                already_stored = self._covered_mask(snapshot, df)
+                new_rows = df[~already_stored]
+                if not new_rows.empty:
+                    snapshot.frames.append(new_rows)
+                    snapshot.rows += len(new_rows)
+
+            for zone in set(zones):
+                covered_names, covered_categories = snapshot.covered(zone)
+                covered_names |= names
+                covered_categories |= categories
+
+    def select(self, sql_key: str, version: str, names: Iterable[str], categories: Iterable[str], zones: Iterable[str]) -> pd.DataFrame:
+        """从存储中按查询条件筛选出结果行。"""
+        with _LOCK:
+            snapshot = self._snapshot(sql_key, version)
+            if len(snapshot.frames) > 1:
+                snapshot.frames = [pd.concat(snapshot.frames, ignore_index=True)]
+            stored = snapshot.frames[0] if snapshot.frames else None
+        if stored is None:
+            return pd.DataFrame()
+
+        mask = (
+            (stored[NAME_COLUMN].astype(str).isin(set(names)) | stored[CATEGORY_COLUMN].astype(str).isin(set(categories)))
+            & stored[ZONE_COLUMN].astype(str).isin(set(zones))
+        )
+        return stored[mask].reset_index(drop=True)
+
+    @staticmethod
+    def _covered_mask(snapshot: _Snapshot, df: pd.DataFrame) -> pd.Series:
+        """标记 df 中已被快照覆盖（即已存储）的行。"""
+        mask = pd.Series(False, index=df.index)
+        if not snapshot.coverage:
+            return mask
+        zone_values = df[ZONE_COLUMN].astype(str)
+        name_values = df[NAME_COLUMN].astype(str)
+        category_values = df[CATEGORY_COLUMN].astype(str)
+        for zone, (covered_names, covered_categories) in snapshot.coverage.items():
+            if covered_names or covered_categories:
+                mask |= (zone_values == zone) & (name_values.isin(covered_names) | category_values.isin(covered_categories))
+        return mask
+
+    @staticmethod
+    def clear():
+        """清空所有快照。"""
+        with _LOCK:
+            _SNAPSHOTS.clear()
@@ -1,30 +1,83 @@
 import pandas as pd
+from pandas.api.types import union_categoricals
 import pymysql
-from sqlalchemy import create_engine
+from sqlalchemy import text
 from pathlib import Path
 import re
-import streamlit as st
-from typing import List, Tuple
-from config import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME, DEFAULT_SQL_FILE, setup_logging
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Callable, List, Optional, Tuple
+from config import (
+    DEFAULT_SQL_FILE, setup_logging,
+    BENCHMARK_TABLE, BENCHMARK_CACHE_MAX_ENTRIES, BENCHMARK_CACHE_MAX_BYTES, BENCHMARK_STORE_MAX_ROWS,
+    SQL_IN_CHUNK_SIZE, SQL_QUERY_WORKERS, BENCHMARK_COLUMN_PROJECTION, BENCHMARK_FETCH_CHUNK_SIZE
+)
+from db.engine import get_engine
+from db.query_cache import QueryCache
+from db.benchmark_store import BenchmarkStore, NAME_COLUMN, ZONE_COLUMN, CATEGORY_COLUMN
+from utils.resource_cache import load_cached, read_text
+from utils.reporter import Reporter
+from db.query_builder import BenchmarkQueryBuilder, ChunkQuery, filter_zones, project_select
 
 logger = setup_logging()
 
+# 裁剪对标品SQL的SELECT列表时，除映射表用到的列外始终保留的输出列：
+# 本地筛选用的战区/通用名/策略分类，以及合并排序用到的商品名称、近90天月均销售数量
+PROJECTION_KEEP_COLUMNS = (ZONE_COLUMN, NAME_COLUMN, CATEGORY_COLUMN, '商品名称', '近90天月均销售数量')
+
+
+def _concat_categorical(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    拼接分块结果。各块列结构相同时，同为分类类型的列用 union_categoricals 合并为同一份类别字典
+    （pd.concat 遇到类别不同的分类列会退回 object）；其余列照常拼接。
+    """
+    frames = [frame for frame in frames if len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    columns = frames[0].columns
+    if not all(frame.columns.equals(columns) for frame in frames):
+        return pd.concat(frames, ignore_index=True)
+
+    parts = []
+    for position in range(len(columns)):
+        series = [frame.iloc[:, position] for frame in frames]
+        if all(isinstance(item.dtype, pd.CategoricalDtype) for item in series):
+            try:
+                parts.append(pd.Series(union_categoricals(series, ignore_order=True)))
+                continue
+            except TypeError:
+                # 各块的类别值类型不同（如某块全为空值），该列按普通拼接退回 object
+                pass
+        parts.append(pd.concat(series, ignore_index=True))
+    df = pd.concat(parts, axis=1, ignore_index=True)
+    df.columns = columns
+    return df
+
 class SQLProcessor:
     """SQL处理器类，负责执行SQL查询"""
 
-    def __init__(self):
-        """初始化数据库连接信息"""
-        self.db_url = (
-            f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
+    def __init__(self, reporter: Reporter = None):
+        """
+        初始化数据库连接信息，引擎与连接池在进程内共享。
+
+        Args:
+            reporter (Reporter): 查询失败等提示信息的出口，默认只写日志。
+        """
+        self.reporter = reporter or Reporter()
+        self.engine = get_engine()
+        self.benchmark_cache = QueryCache(
+            "benchmark", max_entries=BENCHMARK_CACHE_MAX_ENTRIES, max_bytes=BENCHMARK_CACHE_MAX_BYTES
         )
-        self.engine = create_engine(self.db_url)
+        self.benchmark_store = BenchmarkStore(max_rows=BENCHMARK_STORE_MAX_ROWS)
 
     @staticmethod
     def read_sql_file(file_path: Path) -> str:
-        """读取SQL文件内容"""
+        """读取SQL文件内容，文件未修改时复用上次读取的结果"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
+            return load_cached(file_path, read_text)
         except Exception as e:
             logger.error(f"读取SQL文件失败: {e}")
             raise ValueError(f"读取SQL文件失败: {str(e)}")
@@ -40,49 +93,217 @@ class SQLProcessor:
             return df, sql_query
         except Exception as e:
             logger.error(f"执行简单SQL查询失败: {e}")
-            st.error(f"数据库查询失败: {str(e)}")
+            self.reporter.error(f"数据库查询失败: {str(e)}")
             return pd.DataFrame(), sql_query
 
-    def execute_sql_query(self, sql_query: str, cgms: str = None, common_names: List[str] = None, strategy_categories: List[str] = None, lev3_org_name: List[str] = None) -> Tuple[pd.DataFrame, str]:
+    def latest_load_date(self, table_name: str) -> Optional[str]:
+        """
+        查询数据表最新的分区日期(dt)，作为缓存的数据版本。
+        查询失败时返回 None。
+        """
+        try:
+            with self.engine.connect() as connection:
+                value = connection.execute(text(f"SELECT MAX(dt) FROM {table_name}")).scalar()
+            return None if value is None else str(value)
+        except Exception as e:
+            logger.warning(f"查询 {table_name} 最新分区日期失败: {e}")
+            return None
+
+    def execute_cached_query(self, sql_query: str, source_table: str, cache: QueryCache, ttl_seconds: float) -> Tuple[pd.DataFrame, bool]:
+        """
+        执行带缓存的简单查询，缓存键由查询文本和源表的最新分区日期组成。
+        有效期内复用上一次探测到的分区日期，不再访问数据库。
+
+        Returns:
+            Tuple[pd.DataFrame, bool]: 查询结果，以及是否命中缓存。
+        """
+        query_key = cache.make_key(sql_query)
+        version = cache.recent_version(query_key, ttl_seconds)
+        if version is None:
+            # 无法获取分区日期时按自然日作为版本，保证缓存最多保留一天
+            version = self.latest_load_date(source_table) or date.today().isoformat()
+            cache.remember_version(query_key, version)
+
+        cache_key = cache.make_key(sql_query, version)
+        cached_df = cache.get(cache_key)
+        if cached_df is not None:
+            logger.info(f"查询命中缓存 (数据版本: {version})。")
+            return cached_df, True
+
+        df, _ = self.execute_simple_query(sql_query)
+        if not df.empty:
+            cache.put(cache_key, df)
+        return df, False
+
+    def execute_sql_query(self, sql_query: str, cgms: str = None, common_names: List[str] = None, strategy_categories: List[str] = None, lev3_org_name: List[str] = None, use_cache: bool = True, columns: List[str] = None, chunk_transform: Callable[[pd.DataFrame], pd.DataFrame] = None) -> Tuple[pd.DataFrame, str]:
         """
         执行带有动态筛选条件的复杂SQL查询。
+        传入 columns 时，SELECT 列表只保留这些输出列（及 PROJECTION_KEEP_COLUMNS），不再传输会被丢弃的列。
+        传入 chunk_transform 时改为流式读取：服务端游标按 BENCHMARK_FETCH_CHUNK_SIZE 行分块取数，
+        每块经 chunk_transform（映射、预筛选）后再累积，返回的是转换后的结果；此模式不使用缓存与增量存储，
+        扫描行数与保留行数记录在 attrs['query_stats'] 中。
+        结果按 (SQL文本, 采购模式, 通用名, 策略分类, 战区, 最新分区日期) 缓存；
+        未命中时先从对标品增量存储中复用已取回的行，只向数据库补充查询缺少的部分。
+        缓存与增量查询情况记录在返回结果的 attrs['query_stats'] 中。
         返回：一个包含DataFrame和最终执行的SQL语句的元组。
         """
-        final_sql = sql_query
-        
-        # 构建通用名和策略分类的筛选
-        filter_conditions = []
-        if common_names:
-            names_str = "', '".join(name.replace("'", "''") for name in common_names)
-            filter_conditions.append(f"goods_common_name IN ('{names_str}')")
-        if strategy_categories:
-            categories_str = "', '".join(cat.replace("'", "''") for cat in strategy_categories)
-            filter_conditions.append(f"strategy_classify_name IN ('{categories_str}')")
-        if filter_conditions:
-            filter_clause = " OR ".join(filter_conditions)
-            final_sql += f" AND ({filter_clause})"
-        
-        # 构建采购模式和战区的筛选
-        filter_conditions01 = ""
-        if cgms:
-            if cgms == '统采':
-                filter_conditions01 = "lev3_org_name ='集团'"
-            # 增加对lev3_org_name是否存在的检查，修复bug
-            elif lev3_org_name:
-                names_str = "', '".join(name.replace("'", "''") for name in lev3_org_name)
-                filter_conditions01 = f"lev3_org_name ='集团' OR lev3_org_name IN ('{names_str}')"
-        
-        if filter_conditions01:
-            final_sql += f" AND ({filter_conditions01})"
-
+        if columns is not None and BENCHMARK_COLUMN_PROJECTION:
+            sql_query = project_select(sql_query, [*columns, *PROJECTION_KEEP_COLUMNS])
+        builder = BenchmarkQueryBuilder(sql_query, SQL_IN_CHUNK_SIZE)
+        zones = filter_zones(cgms, lev3_org_name)
+        final_sql = builder.render(common_names, strategy_categories, zones)
         logger.info("已将动态筛选条件应用到SQL查询中。")
 
+        if chunk_transform is not None:
+            try:
+                df, rows_scanned = self._run_queries(builder.build(common_names, strategy_categories, zones), chunk_transform)
+                logger.info(f"对标品流式读取完成：扫描 {rows_scanned} 行，保留 {len(df)} 行。")
+                df.attrs['query_stats'] = {"cache_hit": False, "streamed": True, "rows_scanned": rows_scanned, "rows_kept": len(df)}
+                return df, final_sql
+            except Exception as e:
+                logger.error(f"执行SQL查询失败: {e}")
+                self.reporter.error(f"数据库查询失败: {str(e)}")
+                return pd.DataFrame(), final_sql
+
+        # 查询结果缓存：数据版本取对标品表的最新分区日期，获取失败时不使用缓存
+        cache_key = None
+        data_version = self.latest_load_date(BENCHMARK_TABLE) if use_cache else None
+        if data_version:
+            cache_key = self.benchmark_cache.make_key(
+                hashlib.sha256(sql_query.encode('utf-8')).hexdigest(),
+                cgms,
+                sorted(map(str, common_names or [])),
+                sorted(map(str, strategy_categories or [])),
+                # 统采模式不按战区筛选，战区不参与缓存键
+                sorted(map(str, lev3_org_name or [])) if cgms != '统采' else [],
+                data_version,
+            )
+            cached_df = self.benchmark_cache.get(cache_key)
+            if cached_df is not None:
+                logger.info(f"对标品查询命中缓存 (数据日期: {data_version}, {len(cached_df)} 行)。")
+                cached_df.attrs['query_stats'] = {"cache_hit": True, "data_version": data_version}
+                return cached_df, final_sql
+
         # 执行查询
         try:
-            with self.engine.connect() as connection:
-                df = pd.read_sql(final_sql, connection)
+            if data_version and zones and (common_names or strategy_categories) and self.benchmark_store.supports(sql_query):
+                df, query_stats = self._fetch_incremental(
+                    builder, data_version,
+                    list(map(str, common_names or [])), list(map(str, strategy_categories or [])), zones
+                )
+            else:
+                df, _ = self._run_queries(builder.build(common_names, strategy_categories, zones))
+                query_stats = {"fetched_rows": len(df)}
+            if cache_key and not df.empty:
+                self.benchmark_cache.put(cache_key, df)
+            df.attrs['query_stats'] = {"cache_hit": False, "data_version": data_version, **query_stats}
             return df, final_sql
         except Exception as e:
             logger.error(f"执行SQL查询失败: {e}")
-            st.error(f"数据库查询失败: {str(e)}")
+            self.reporter.error(f"数据库查询失败: {str(e)}")
             return pd.DataFrame(), final_sql
+
+    def prefetch(self, sql_query: str, common_names: List[str], strategy_categories: List[str], zones: List[str], columns: List[str] = None) -> Optional[pd.DataFrame]:
+        """
+        按给定条件（通常是多份SCM文件筛选条件的并集）一次性把对标品行取入增量存储，
+        之后各文件以子集条件调用 execute_sql_query 时直接在存储中本地筛选，不再访问数据库。
+        columns 需与之后的 execute_sql_query 一致，两者才会使用同一份存储。
+        无法使用增量存储（SQL缺少本地筛选列、无法获取分区日期或没有战区条件）时返回 None。
+
+        Returns:
+            Optional[pd.DataFrame]: 满足并集条件的全部对标品行；预取的行数、通用名/策略分类/战区数量
+            与数据日期记录在 attrs['query_stats'] 中。
+        """
+        if columns is not None and BENCHMARK_COLUMN_PROJECTION:
+            sql_query = project_select(sql_query, [*columns, *PROJECTION_KEEP_COLUMNS])
+        if not zones or not (common_names or strategy_categories) or not self.benchmark_store.supports(sql_query):
+            return None
+        data_version = self.latest_load_date(BENCHMARK_TABLE)
+        if not data_version:
+            return None
+
+        names = sorted(set(map(str, common_names or [])))
+        categories = sorted(set(map(str, strategy_categories or [])))
+        builder = BenchmarkQueryBuilder(sql_query, SQL_IN_CHUNK_SIZE)
+        df, query_stats = self._fetch_incremental(builder, data_version, names, categories, sorted(set(zones)))
+        logger.info(f"对标品预取完成：{len(names)} 个通用名、{len(categories)} 个策略分类，取回 {query_stats['fetched_rows']} 行。")
+        df.attrs['query_stats'] = {
+            "fetched_rows": query_stats["fetched_rows"], "rows": len(df), "common_names": len(names),
+            "strategy_categories": len(categories), "zones": len(set(zones)), "data_version": data_version,
+        }
+        return df
+
+    def _run_queries(self, queries: List[ChunkQuery], chunk_transform: Callable[[pd.DataFrame], pd.DataFrame] = None) -> Tuple[pd.DataFrame, int]:
+        """
+        并发执行拆分后的查询，按拆分顺序拼接结果。
+        策略分类批次中通用名已由通用名批次取回的行会被剔除，避免重复。
+        传入 chunk_transform 时以服务端游标分块读取，每块去重后立即转换；
+        转换结果的文本列以分类类型累积以压缩重复值，各块与各条查询的同一列由 union_categoricals
+        合并为同一份类别字典，返回的结果保持分类类型（由 key_types.from_chunks 统一键列的类别顺序）。
+
+        Returns:
+            Tuple[pd.DataFrame, int]: 结果，以及从数据库扫描的行数。
+        """
+        def exclude(query: ChunkQuery, chunk_df: pd.DataFrame) -> pd.DataFrame:
+            if query.exclude_names and NAME_COLUMN in chunk_df.columns:
+                chunk_df = chunk_df[~chunk_df[NAME_COLUMN].astype(str).isin(query.exclude_names)]
+            return chunk_df
+
+        def run(query: ChunkQuery) -> Tuple[pd.DataFrame, int, bool]:
+            if chunk_transform is None:
+                with self.engine.connect() as connection:
+                    chunk_df = pd.read_sql(query.statement, connection, params=query.params)
+                return exclude(query, chunk_df), len(chunk_df), NAME_COLUMN in chunk_df.columns
+
+            frames, rows_scanned, has_names = [], 0, True
+            with self.engine.connect() as connection:
+                connection = connection.execution_options(stream_results=True)
+                for chunk_df in pd.read_sql(query.statement, connection, params=query.params, chunksize=BENCHMARK_FETCH_CHUNK_SIZE):
+                    rows_scanned += len(chunk_df)
+                    has_names = has_names and NAME_COLUMN in chunk_df.columns
+                    kept = chunk_transform(exclude(query, chunk_df))
+                    if not kept.empty:
+                        frames.append(kept.astype({
+                            col: 'category' for col, dtype in kept.dtypes.items() if dtype == object
+                        }))
+            return _concat_categorical(frames), rows_scanned, has_names
+
+        if len(queries) == 1:
+            results = [run(queries[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(SQL_QUERY_WORKERS, len(queries))) as executor:
+                results = list(executor.map(run, queries))
+
+        if chunk_transform is not None:
+            df = _concat_categorical([frame for frame, _, _ in results])
+        else:
+            df = pd.concat([frame for frame, _, _ in results], ignore_index=True) if len(results) > 1 else results[0][0]
+        if len(results) > 1 and not all(has_names for _, _, has_names in results):
+            # 无法按通用名判断重复时，退回按整行去重
+            df = df.drop_duplicates(ignore_index=True)
+        if len(queries) > 1:
+            logger.info(f"对标品查询已拆分为 {len(queries)} 条并发执行，合计 {len(df)} 行。")
+        return df, sum(rows_scanned for _, rows_scanned, _ in results)
+
+    def _fetch_incremental(self, builder: BenchmarkQueryBuilder, data_version: str, names: List[str], categories: List[str], zones: List[str]) -> Tuple[pd.DataFrame, dict]:
+        """
+        只向数据库查询增量存储中尚未覆盖的 (通用名/策略分类, 战区) 部分，
+        并入存储后再按完整条件在本地筛选出结果。
+        """
+        sql_key = hashlib.sha256(builder.base_sql.encode('utf-8')).hexdigest()
+        missing_names, missing_categories, fetch_zones = self.benchmark_store.missing(
+            sql_key, data_version, names, categories, zones
+        )
+
+        fetched_rows = 0
+        if fetch_zones:
+            fetched_df, _ = self._run_queries(builder.build(missing_names, missing_categories, fetch_zones))
+            fetched_rows = len(fetched_df)
+            self.benchmark_store.add(sql_key, data_version, fetched_df, missing_names, missing_categories, fetch_zones)
+            logger.info(
+                f"对标品增量查询：补充 {len(missing_names)} 个通用名、{len(missing_categories)} 个策略分类、"
+                f"{len(fetch_zones)} 个战区，取回 {fetched_rows} 行。"
+            )
+
+        df = self.benchmark_store.select(sql_key, data_version, names, categories, zones)
+        return df, {"fetched_rows": fetched_rows, "incremental": True}
@@ -0,0 +1,82 @@
+"""
+进程级共享的数据库引擎。
+Streamlit 每次交互都会重新执行脚本并重新构建处理器，引擎放在模块级对象中，
+保证同一进程内所有重跑与会话共用一个已预热的连接池。
+"""
+
+import threading
+import time
+from typing import Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from config import (
+    DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME, setup_logging,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_POOL_WARM_CONNECTIONS
+)
+
+logger = setup_logging()
+
+_ENGINE: Optional[Engine] = None
+_LOCK = threading.Lock()
+
+
+def database_url() -> str:
+    """返回数据库连接地址。"""
+    return f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
+
+
+def get_engine() -> Engine:
+    """返回进程内共享的引擎；首次调用时创建连接池，并在后台线程中预热。"""
+    global _ENGINE
+    if _ENGINE is None:
+        with _LOCK:
+            if _ENGINE is None:
+                _ENGINE = create_engine(
+                    database_url(),
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE,
+                    pool_pre_ping=DB_POOL_PRE_PING,
+                )
+                threading.Thread(target=warm_up, args=(_ENGINE,), name="db-warm-up", daemon=True).start()
+    return _ENGINE
+
+
+def warm_up(engine: Engine, connections: int = DB_POOL_WARM_CONNECTIONS):
+    """预先建立若干连接并归还连接池，避免第一次查询承担建连开销。失败时只记录日志。"""
+    opened = []
+    try:
+        for _ in range(connections):
+            connection = engine.connect()
+            opened.append(connection)
+            connection.execute(text("SELECT 1"))
+        logger.info(f"数据库连接池已预热 {len(opened)} 个连接。")
+    except Exception as e:
+        logger.warning(f"数据库连接池预热失败: {e}")
+    finally:
+        for connection in opened:
+            connection.close()
+
+
+def probe(engine: Engine = None) -> dict:
+    """
+    检测数据库连通性与往返延迟。
+
+    Returns:
+        dict: ok（是否可用）、latency_ms（SELECT 1 往返毫秒数）、pool（连接池状态）、error（失败原因）。
+    """
+    engine = engine or get_engine()
+    start = time.perf_counter()
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return {
+            "ok": True,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "pool": engine.pool.status(),
+            "error": None,
+        }
+    except Exception as e:
+        logger.warning(f"数据库连通性检测失败: {e}")
+        return {"ok": False, "latency_ms": None, "pool": engine.pool.status(), "error": str(e)}
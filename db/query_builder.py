@@ -0,0 +1,214 @@
+"""
+对标品查询的构建：SELECT 列表按需裁剪，以及动态筛选条件。
+筛选值全部以绑定参数传入，较长的 IN 列表按固定大小拆分为多条查询，
+另外生成一条把参数值直接写入的可读 SQL，仅用于界面展示和日志。
+"""
+
+import re
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy import bindparam, text
+from sqlalchemy.sql.elements import TextClause
+
+GROUP_ZONE = '集团'
+# 展示用 SQL 中每个 IN 列表最多列出的值数量
+DISPLAY_VALUES_LIMIT = 20
+
+
+class SelectItem(NamedTuple):
+    """SELECT 列表中的一项。"""
+    text: str
+    # 反引号中的输出列名；无法识别别名时为 None，这类项总是保留
+    alias: Optional[str]
+
+
+class SelectList(NamedTuple):
+    """拆分后的 SQL：SELECT 关键字之前的部分、各选择项、FROM 及之后的部分。"""
+    head: str
+    items: Tuple[SelectItem, ...]
+    tail: str
+
+
+_ALIAS_PATTERN = re.compile(r'\bAS\s+`([^`]+)`\s*$', re.IGNORECASE)
+
+
+def _strip_comment(item: str) -> str:
+    """去掉选择项中 -- 开头的行尾注释（不处理引号内的 --）。"""
+    lines = []
+    for line in item.splitlines():
+        in_quote = None
+        for pos, char in enumerate(line):
+            if in_quote:
+                if char == in_quote:
+                    in_quote = None
+            elif char in ("'", '"', '`'):
+                in_quote = char
+            elif line.startswith('--', pos):
+                line = line[:pos]
+                break
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+
+@lru_cache(maxsize=8)
+def parse_select(sql: str) -> Optional[SelectList]:
+    """
+    按顶层逗号拆分最外层 SELECT 列表，识别各项的反引号别名。
+    同一份 SQL 文本只解析一次；无法识别结构时返回 None。
+    """
+    match = re.match(r'\s*SELECT\b', sql, re.IGNORECASE)
+    if match is None:
+        return None
+
+    items, depth, in_quote, in_comment = [], 0, None, False
+    start = pos = match.end()
+    while pos < len(sql):
+        char = sql[pos]
+        if in_comment:
+            in_comment = char != '\n'
+        elif in_quote:
+            if char == in_quote:
+                in_quote = None
+        elif char in ("'", '"', '`'):
+            in_quote = char
+        elif sql.startswith('--', pos):
+            in_comment = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0 and char == ',':
+            items.append(sql[start:pos])
+            start = pos + 1
+        elif depth == 0 and re.match(r'FROM\b', sql[pos:pos + 5], re.IGNORECASE) and not (sql[pos - 1].isalnum() or sql[pos - 1] == '_'):
+            items.append(sql[start:pos])
+            parsed = tuple(
+                SelectItem(item, alias.group(1) if (alias := _ALIAS_PATTERN.search(_strip_comment(item))) else None)
+                for item in items
+            )
+            return SelectList(sql[:match.end()], parsed, sql[pos:])
+        pos += 1
+    return None
+
+
+def project_select(sql: str, columns: Iterable[str]) -> str:
+    """
+    把最外层 SELECT 列表裁剪为 columns 中的输出列（以及无法识别别名的项），
+    其余部分保持不变；无法解析或裁剪后没有任何列时返回原 SQL。
+    """
+    parsed = parse_select(sql)
+    if parsed is None:
+        return sql
+    columns = set(columns)
+    kept = [item.text for item in parsed.items if item.alias is None or item.alias in columns]
+    if not kept or len(kept) == len(parsed.items):
+        return sql
+    # 各项保留原有的缩进和行尾注释；末项之后换行，避免 FROM 落入注释
+    return f"{parsed.head} {','.join(kept).strip()}\n{parsed.tail}"
+
+
+class ChunkQuery(NamedTuple):
+    """拆分后的一条查询。"""
+    statement: TextClause
+    params: dict
+    # 非空时，结果中 通用名 属于该集合的行已由通用名分批查询取回，需要去重
+    exclude_names: Optional[frozenset]
+
+
+def chunked(values: Sequence, size: int) -> List[list]:
+    """把列表按 size 个一组拆分。"""
+    values = list(values)
+    return [values[start:start + size] for start in range(0, len(values), size)]
+
+
+def filter_zones(cgms: str = None, lev3_org_name: List[str] = None) -> List[str]:
+    """
+    返回采购模式对应的战区筛选列表：统采只取集团数据，地采取集团及提报战区的数据；
+    返回空列表表示不按战区筛选。
+    """
+    if cgms == '统采':
+        return [GROUP_ZONE]
+    # 增加对lev3_org_name是否存在的检查，修复bug
+    if cgms and lev3_org_name:
+        return [GROUP_ZONE] + [str(zone) for zone in lev3_org_name if str(zone) != GROUP_ZONE]
+    return []
+
+
+def _quote(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _display_list(values: Sequence) -> str:
+    shown = ", ".join(_quote(value) for value in values[:DISPLAY_VALUES_LIMIT])
+    if len(values) > DISPLAY_VALUES_LIMIT:
+        shown += f", /* … 共 {len(values)} 项 */"
+    return f"({shown})"
+
+
+class BenchmarkQueryBuilder:
+    """为对标品 SQL 追加 (通用名 IN … OR 策略分类 IN …) AND 战区 IN … 的筛选条件。"""
+
+    def __init__(self, base_sql: str, chunk_size: int):
+        """
+        Args:
+            base_sql (str): SQL 文件内容，需以可追加 AND 条件的 WHERE 子句结尾。
+            chunk_size (int): 单条查询中每个 IN 列表最多包含的值数量。
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size 必须是正整数")
+        self.base_sql = base_sql
+        self.chunk_size = chunk_size
+        # SQL 文本中形如 :name 的片段会被当作绑定参数，需要转义
+        self._escaped_sql = re.sub(r'(?<![:\w\\]):(?=\w)', r'\\:', base_sql)
+
+    def build(self, common_names: List[str] = None, strategy_categories: List[str] = None, zones: List[str] = None) -> List[ChunkQuery]:
+        """
+        生成绑定参数形式的查询列表。
+        通用名与策略分类分别分批查询；策略分类批次的结果需剔除通用名已命中的行，
+        这样各批结果拼接后与单条 OR 查询的结果一致。
+        """
+        common_names = [str(name) for name in common_names or []]
+        strategy_categories = [str(category) for category in strategy_categories or []]
+        zone_sql = " AND (lev3_org_name IN :zones)" if zones else ""
+        zone_params = {"zones": list(zones)} if zones else {}
+
+        queries = []
+        for names in chunked(common_names, self.chunk_size):
+            queries.append(self._query(
+                " AND (goods_common_name IN :values)" + zone_sql, {"values": names, **zone_params}, None
+            ))
+        exclude_names = frozenset(common_names) or None
+        for categories in chunked(strategy_categories, self.chunk_size):
+            queries.append(self._query(
+                " AND (strategy_classify_name IN :values)" + zone_sql, {"values": categories, **zone_params}, exclude_names
+            ))
+        if not queries:
+            queries.append(self._query(zone_sql, zone_params, None))
+        return queries
+
+    def _query(self, filter_sql: str, params: dict, exclude_names: Optional[frozenset]) -> ChunkQuery:
+        statement = text(self._escaped_sql + filter_sql)
+        for name in params:
+            statement = statement.bindparams(bindparam(name, expanding=True))
+        return ChunkQuery(statement, params, exclude_names)
+
+    def render(self, common_names: List[str] = None, strategy_categories: List[str] = None, zones: List[str] = None) -> str:
+        """生成值直接写入的代表性 SQL（过长的 IN 列表会被截断），仅用于展示。"""
+        common_names = list(common_names or [])
+        strategy_categories = list(strategy_categories or [])
+        rendered = self.base_sql
+
+        filter_conditions = []
+        if common_names:
+            filter_conditions.append(f"goods_common_name IN {_display_list(common_names)}")
+        if strategy_categories:
+            filter_conditions.append(f"strategy_classify_name IN {_display_list(strategy_categories)}")
+        if filter_conditions:
+            rendered += f" AND ({' OR '.join(filter_conditions)})"
+        if zones:
+            rendered += f" AND (lev3_org_name IN {_display_list(list(zones))})"
+
+        batches = len(chunked(common_names, self.chunk_size)) + len(chunked(strategy_categories, self.chunk_size))
+        if batches > 1:
+            rendered += f"\n/* 通用名与策略分类按每批最多 {self.chunk_size} 项拆分为 {batches} 条绑定参数查询执行 */"
+        return rendered
@@ -0,0 +1,153 @@
+"""
+查询结果缓存：进程内字典 + 缓存目录下的 Parquet 文件。
+进程内缓存为模块级对象，Streamlit 的每次重跑和每个会话都共享同一份。
+可设置条目数与磁盘占用上限，超出时按最近最少使用(LRU)顺序淘汰；也可只使用进程内缓存。
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import pandas as pd
+from config import CACHE_DIR, setup_logging
+
+logger = setup_logging()
+
+# {命名空间: {缓存键: (DataFrame, 写入时间)}}
+_MEMORY = {}
+# {命名空间: {查询键: (数据版本, 探测时间)}}
+_VERSIONS = {}
+_LOCK = threading.Lock()
+
+
+class QueryCache:
+    """按命名空间隔离的两级查询结果缓存。"""
+
+    def __init__(self, namespace: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = None, persist: bool = True):
+        """
+        Args:
+            namespace (str): 缓存命名空间，同时作为 Parquet 文件所在的子目录名。
+            max_entries (int): 最多保留的缓存条目数，None 表示不限制。
+            max_bytes (int): 磁盘缓存的总大小上限（字节），None 表示不限制。
+            persist (bool): 是否写入磁盘缓存；为 False 时只使用进程内缓存。
+        """
+        self.namespace = namespace
+        self.persist = persist
+        self.directory = CACHE_DIR / namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        with _LOCK:
+            self._memory = _MEMORY.setdefault(namespace, OrderedDict())
+            self._versions = _VERSIONS.setdefault(namespace, {})
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """由查询文本、版本号等组成部分生成稳定的缓存键。"""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(repr(part).encode('utf-8'))
+            digest.update(b'\x1f')
+        return digest.hexdigest()
+
+    def recent_version(self, query_key: str, ttl_seconds: float):
+        """返回有效期内最近一次探测到的数据版本；超出有效期或从未探测时返回 None。"""
+        with _LOCK:
+            entry = self._versions.get(query_key)
+        if entry is None or time.time() - entry[1] >= ttl_seconds:
+            return None
+        return entry[0]
+
+    def remember_version(self, query_key: str, version: str):
+        """记录本次探测到的数据版本。"""
+        with _LOCK:
+            self._versions[query_key] = (version, time.time())
+
+    def _path(self, key: str):
+        return self.directory / f"{key}.parquet"
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """读取缓存，依次查找进程内缓存和磁盘缓存；未命中时返回 None。"""
+        path = self._path(key)
+        with _LOCK:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        if entry is not None:
+            self._touch(path)
+            return entry[0].copy()
+
+        if not self.persist or not path.exists():
+            return None
+        try:
+            df = pd.read_parquet(path)
+        except Exception as e:
+            logger.warning(f"读取缓存文件 {path} 失败: {e}")
+            return None
+
+        self._touch(path)
+        with _LOCK:
+            self._memory[key] = (df, time.time())
+            self._evict_memory()
+        return df.copy()
+
+    def put(self, key: str, df: pd.DataFrame):
+        """写入缓存；磁盘写入失败时仅保留进程内缓存。"""
+        with _LOCK:
+            self._memory[key] = (df.copy(), time.time())
+            self._memory.move_to_end(key)
+            self._evict_memory()
+        if not self.persist:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            df.to_parquet(self._path(key), index=False)
+        except Exception as e:
+            logger.warning(f"写入缓存文件失败，仅保留进程内缓存: {e}")
+            return
+        self._evict_disk()
+
+    @staticmethod
+    def _touch(path):
+        """更新缓存文件的修改时间，作为磁盘 LRU 的最近使用时间。"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _evict_memory(self):
+        """淘汰超出条目上限的进程内缓存（调用方需持有锁）。"""
+        while self.max_entries is not None and len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """按最近使用时间从旧到新删除磁盘缓存，直到满足条目数与总大小上限。"""
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        files = sorted(self.directory.glob("*.parquet"), key=lambda path: path.stat().st_mtime)
+        total_bytes = sum(path.stat().st_size for path in files)
+        while files and (
+            (self.max_entries is not None and len(files) > self.max_entries)
+            or (self.max_bytes is not None and total_bytes > self.max_bytes)
+        ):
+            oldest = files.pop(0)
+            total_bytes -= oldest.stat().st_size
+            try:
+                oldest.unlink()
+                logger.info(f"缓存超出上限，已淘汰: {oldest.name}")
+            except OSError as e:
+                logger.warning(f"淘汰缓存文件 {oldest} 失败: {e}")
+
+    def clear(self):
+        """清空该命名空间下的进程内缓存与磁盘缓存。"""
+        with _LOCK:
+            self._memory.clear()
+            self._versions.clear()
+        if self.directory.exists():
+            for path in self.directory.glob("*.parquet"):
+                try:
+                    path.unlink()
+                except Exception as e:
+                    logger.warning(f"删除缓存文件 {path} 失败: {e}")
+        logger.info(f"已清空缓存: {self.namespace}")
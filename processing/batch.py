@@ -0,0 +1,194 @@
+"""
+命令行批处理：用同一份映射表处理多份SCM导出文件，输出各自的Excel结果与一份JSON运行摘要。
+同一文件中地采、统采混合时按行分别处理，结果为同一工作簿中的两个工作表（见 AnalysisPipeline）。
+缓冲读取模式下先按所有文件筛选条件的并集取数一次（SharedBenchmarkFetch），各文件从索引中取出自己的子集。
+BATCH_WORKERS 大于 1 时，各文件的映射、合并、格式化与导出分发到进程池中并行执行：
+取回的对标品行写成只读的 Arrow 快照文件，工作进程以内存映射方式打开并建立索引，不再访问数据库；
+否则在当前进程中逐个处理。
+"""
+
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+import pandas as pd
+from config import setup_logging, BATCH_WORKERS
+from db.benchmark_snapshot import SnapshotSQLProcessor
+from utils.reporter import Reporter
+from .enrichment import BaseDataEnricher
+from .pipeline import AnalysisPipeline
+from .shared_fetch import SharedBenchmarkFetch
+
+logger = setup_logging()
+
+SUMMARY_FILE_NAME = "run_summary.json"
+SNAPSHOT_FILE_NAME = "benchmark.feather"
+
+
+def _execute(pipeline: AnalysisPipeline, map_df: pd.DataFrame, scm_df: pd.DataFrame, path: Path, out_dir: Path) -> dict:
+    """运行一个文件的分析流程并写出结果文件，返回写入运行摘要的字段。"""
+    started = time.perf_counter()
+    record = {"worker": os.getpid()}
+    try:
+        result = pipeline.run(map_df.copy(), scm_df.copy())
+        output_path = out_dir / f"{path.stem}_{result['result_filename']}"
+        output_path.write_bytes(result["result_output"].getvalue())
+        record.update({
+            "status": "ok",
+            "output": str(output_path),
+            "new_product_count": result["new_product_count"],
+            "rows": int(result["result_df"].shape[0]),
+            "export_stats": result.get("export_stats"),
+        })
+    except Exception as e:
+        logger.error(f"处理 {path} 失败: {e}", exc_info=True)
+        record.update({"status": "failed", "error": str(e)})
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def _run_in_worker(map_df: pd.DataFrame, scm_df: pd.DataFrame, path: Path, out_dir: Path, snapshot: Optional[tuple]) -> dict:
+    """
+    工作进程入口：有快照时从快照文件中取对标品数据，否则使用本进程自己的连接池查询数据库。
+    snapshot 为 (快照文件路径, 三级大类源列, 本任务的三级大类)。
+    """
+    from db.database_handler import SQLProcessor
+    from processing.data_formatter import DataFormatter
+    from processing.data_mapper import MappingProcessor
+    from processing.data_merger import DataMerger
+    from processing.data_processor import DataProcessor
+    from utils.exporter import ResultExporter
+
+    reporter = Reporter()
+    processors = {
+        "sql": SnapshotSQLProcessor(*snapshot, reporter=reporter) if snapshot else SQLProcessor(reporter=reporter),
+        "mapper": MappingProcessor(),
+        "merger": DataMerger(),
+        "processor": DataProcessor(),
+        "formatter": DataFormatter(),
+        "exporter": ResultExporter(),
+        "reporter": reporter,
+    }
+    pipeline = AnalysisPipeline(purchase_mode=None, processors=processors)
+    record = _execute(pipeline, map_df, scm_df, path, out_dir)
+    record["messages"] = [{"level": level, "message": message} for level, message in reporter.messages]
+    return record
+
+
+class BatchRunner:
+    """批量运行分析流程。"""
+
+    def __init__(self, processors: dict, enricher: BaseDataEnricher, reporter: Reporter, workers: int = BATCH_WORKERS):
+        """
+        Args:
+            processors (dict): AnalysisPipeline 使用的处理器实例。
+            enricher (BaseDataEnricher): SCM文件的读取与医保目录关联。
+            reporter (Reporter): 提示信息的出口，其中记录的信息按文件写入运行摘要。
+            workers (int): 并行处理的进程数；1 表示在当前进程中逐个处理。
+        """
+        if workers < 1:
+            raise ValueError("workers 必须是正整数")
+        self.processors = {**processors, "reporter": reporter}
+        self.enricher = enricher
+        self.reporter = reporter
+        self.workers = workers
+
+    def run(self, map_df: pd.DataFrame, scm_paths: List[Path], out_dir: Path) -> dict:
+        """
+        处理所有SCM文件，结果文件与运行摘要写入 out_dir。
+
+        Returns:
+            dict: 运行摘要（同时写入 out_dir / run_summary.json）。
+        """
+        started = time.perf_counter()
+        started_at = datetime.now().isoformat(timespec="seconds")
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        # 1. 读取并关联所有文件，确定各自包含的采购模式
+        jobs, results = [], []
+        for path in scm_paths:
+            record = {"file": str(path), "status": "failed"}
+            results.append(record)
+            first_message = len(self.reporter.messages)
+            try:
+                scm_df = self.enricher.enrich(self.enricher.read_scm(path, map_df))
+                record["purchase_mode"] = "、".join(AnalysisPipeline.partition(scm_df))
+                jobs.append((path, scm_df, record))
+            except Exception as e:
+                logger.error(f"读取 {path} 失败: {e}")
+                record["error"] = str(e)
+            record["messages"] = self._messages_since(first_message)
+
+        # 2. 按所有文件（混合采购模式的文件按各模式的部分）筛选条件的并集取数一次
+        shared = SharedBenchmarkFetch(self.processors["sql"], map_df)
+        prefetch_df = shared.fetch([
+            benchmark_job
+            for path, scm_df, record in jobs
+            for benchmark_job in AnalysisPipeline(purchase_mode=None, processors=self.processors).benchmark_jobs(scm_df)
+        ])
+        workers = max(min(self.workers, len(jobs)), 1)
+
+        # 3. 运行各文件的分析流程并写出结果
+        if workers > 1:
+            self._run_parallel(map_df, jobs, out_dir, workers, shared)
+        else:
+            for path, scm_df, record in jobs:
+                first_message = len(self.reporter.messages)
+                self.reporter.status(f"正在处理 {path.name}（{record['purchase_mode']}）…")
+                indexed_processor = shared.processor_for(scm_df, self.reporter)
+                processors = {**self.processors, "sql": indexed_processor} if indexed_processor else self.processors
+                pipeline = AnalysisPipeline(purchase_mode=None, processors=processors)
+                record.update(_execute(pipeline, map_df, scm_df, path, out_dir))
+                record["messages"] += self._messages_since(first_message)
+
+        summary = {
+            "started_at": started_at,
+            "seconds": round(time.perf_counter() - started, 3),
+            "output_dir": str(out_dir),
+            "workers": workers,
+            "prefetch": prefetch_df.attrs.get('query_stats') if prefetch_df is not None else None,
+            "succeeded": sum(record["status"] == "ok" for record in results),
+            "failed": sum(record["status"] != "ok" for record in results),
+            "files": results,
+        }
+        with open(out_dir / SUMMARY_FILE_NAME, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2, default=str)
+        logger.info(f"批处理完成：成功 {summary['succeeded']} 个，失败 {summary['failed']} 个，摘要已写入 {out_dir / SUMMARY_FILE_NAME}")
+        return summary
+
+    def _run_parallel(self, map_df: pd.DataFrame, jobs: list, out_dir: Path, workers: int, shared: SharedBenchmarkFetch):
+        """在进程池中处理各文件；共享取数的结果写成快照文件，由各工作进程以内存映射方式共享。"""
+        with tempfile.TemporaryDirectory(prefix="batch_") as temp_dir:
+            snapshot_path = None
+            if shared.frame is not None:
+                snapshot_path = Path(temp_dir) / SNAPSHOT_FILE_NAME
+                SnapshotSQLProcessor.write(shared.frame, snapshot_path)
+
+            # 使用 spawn 启动工作进程，不继承主进程的连接池与后台线程
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = [
+                    (record, executor.submit(
+                        _run_in_worker, map_df, scm_df, path, out_dir,
+                        (snapshot_path, shared.lev3_column, shared.lev3_categories(scm_df)) if snapshot_path else None
+                    ))
+                    for path, scm_df, record in jobs
+                ]
+                logger.info(f"已将 {len(futures)} 个文件分发到 {workers} 个进程处理。")
+                for record, future in futures:
+                    try:
+                        outcome = future.result()
+                    except Exception as e:
+                        logger.error(f"处理 {record['file']} 的工作进程异常退出: {e}")
+                        record["error"] = str(e)
+                        continue
+                    record["messages"] += outcome.pop("messages")
+                    record.update(outcome)
+
+    def _messages_since(self, first: int) -> List[dict]:
+        return [{"level": level, "message": message} for level, message in self.reporter.messages[first:]]
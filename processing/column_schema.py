@@ -0,0 +1,134 @@
+"""
+目标表字段的格式规则，是 DataFormatter 与 ResultExporter 共用的唯一来源。
+模块加载时把每个字段的转换函数和 Excel 数字格式编译成索引；
+对当前映射表的列顺序再编译一次按列位置排列的规则表，避免逐列做列表成员查找。
+"""
+
+from functools import lru_cache
+from typing import Callable, List, NamedTuple, Optional, Tuple
+import numpy as np
+import pandas as pd
+from config import setup_logging
+
+logger = setup_logging()
+
+# --- 定义数字格式 ---
+PERCENT_FORMAT = '0.00%;-0.00%;0.00%;@'
+DECIMAL_2_FORMAT = '0.00;-0.00;0.00;@'
+DECIMAL_1_FORMAT = '0.0;-0.0;0.0;@'
+INTEGER_FORMAT = '0;-0;0;@'
+TEXT_FORMAT = '@'
+
+# 转换规则类型 -> 转换函数
+CONVERTERS = {
+    'date': lambda s: s.astype(str).replace('nan', np.nan).replace('NaT', np.nan),
+    'str': lambda s: s.astype(str).replace('nan', np.nan),
+    'percent': lambda s: pd.to_numeric(s, errors='coerce') / 100,
+    'decimal_2': lambda s: pd.to_numeric(s, errors='coerce').round(2),
+    'decimal_1': lambda s: pd.to_numeric(s, errors='coerce').round(1),
+    'int': lambda s: pd.to_numeric(s, errors='coerce').round(0),
+}
+NUMERIC_KINDS = {'percent', 'decimal_2', 'decimal_1', 'int'}
+
+# 目标字段 -> (转换规则, Excel数字格式)；任一项为 None 表示该环节不处理
+COLUMN_SCHEMA = {
+    '填报日期': ('date', None),
+    '过会编码': ('str', TEXT_FORMAT), '新品编码': ('str', TEXT_FORMAT),
+    '商品编码': ('str', None), '国际条码': ('str', TEXT_FORMAT),
+    '返利率(%)': ('percent', PERCENT_FORMAT),
+    '通用名补偿后毛利率': (None, PERCENT_FORMAT),
+    '日服/使用成交价（顾客）': ('decimal_2', DECIMAL_2_FORMAT), '日服/使用底价': ('decimal_2', DECIMAL_2_FORMAT),
+    '标准单位进价': ('decimal_2', DECIMAL_2_FORMAT), '标准单位底价': ('decimal_2', DECIMAL_2_FORMAT),
+    '标准单位成交价': ('decimal_2', DECIMAL_2_FORMAT), '标准单位综合毛利额': ('decimal_2', DECIMAL_2_FORMAT),
+    '标准单位零售定价': ('decimal_2', DECIMAL_2_FORMAT), '进价': ('decimal_2', DECIMAL_2_FORMAT),
+    '新品底价/对标品最低底价': ('decimal_2', DECIMAL_2_FORMAT), '底价 *(返利后)': ('decimal_2', DECIMAL_2_FORMAT),
+    '近90天门店最新一批的底价': ('decimal_2', DECIMAL_2_FORMAT), '近90天门店级最低底价': ('decimal_2', DECIMAL_2_FORMAT),
+    '9000的移动平均价': ('decimal_2', DECIMAL_2_FORMAT), '9000的最后进价': ('decimal_2', DECIMAL_2_FORMAT),
+    '【使用最新】近90天购进批次的最新底价-不含销售返利': ('decimal_2', DECIMAL_2_FORMAT),
+    '【使用最低】近90天购进批次的最低底价': ('decimal_2', DECIMAL_2_FORMAT),
+    '预估/实际成交价': ('decimal_1', DECIMAL_1_FORMAT), '建议零售价': ('decimal_1', DECIMAL_1_FORMAT),
+    # 对于整数列，只做四舍五入，暂时保留为数值类型
+    '动销战区数': ('int', None), '效期（天）': ('int', None),
+    '近90天月均销售数量': ('int', INTEGER_FORMAT), '近90天月均销售金额': ('int', INTEGER_FORMAT),
+    '近90天月均前台含税毛利额': ('int', INTEGER_FORMAT), '近90天月均补偿后含税毛利额': ('int', INTEGER_FORMAT),
+    '超级旗舰店铺货商品数量': ('int', INTEGER_FORMAT), '旗舰店铺货商品数量': ('int', INTEGER_FORMAT),
+    '大店铺货商品数量': ('int', INTEGER_FORMAT), '中店铺货商品数量': ('int', INTEGER_FORMAT),
+    '小店铺货商品数量': ('int', INTEGER_FORMAT), '成长店铺货商品数量': ('int', INTEGER_FORMAT),
+    '通用名月均销量': ('int', INTEGER_FORMAT), '通用名月均销售额': ('int', INTEGER_FORMAT),
+    '通用名月均前台毛利额': ('int', INTEGER_FORMAT), '通用名月均补偿后毛利额': ('int', INTEGER_FORMAT),
+}
+RED_FONT_COLUMNS = {'新品底价/对标品最低底价', '底价 *(返利后)'}
+
+
+class ColumnRule(NamedTuple):
+    """单个目标字段的已编译规则。"""
+    kind: Optional[str]
+    converter: Optional[Callable[[pd.Series], pd.Series]]
+    number_format: Optional[str]
+    font: str
+
+
+def _build_rule(column) -> ColumnRule:
+    kind, number_format = COLUMN_SCHEMA.get(column, (None, None))
+    return ColumnRule(
+        kind=kind,
+        converter=CONVERTERS.get(kind),
+        number_format=number_format,
+        font='red' if column in RED_FONT_COLUMNS else 'default',
+    )
+
+
+# 模块加载时编译一次的字段规则索引
+FIELD_RULES = {column: _build_rule(column) for column in COLUMN_SCHEMA.keys() | RED_FONT_COLUMNS}
+DEFAULT_RULE = ColumnRule(kind=None, converter=None, number_format=None, font='default')
+
+
+@lru_cache(maxsize=32)
+def _compile_columns(columns: Tuple) -> Tuple[ColumnRule, ...]:
+    return tuple(FIELD_RULES.get(column, DEFAULT_RULE) for column in columns)
+
+
+def compile_columns(columns) -> Tuple[ColumnRule, ...]:
+    """
+    按列位置返回规则表，同一列顺序（即同一版本映射表）只编译一次。
+
+    Args:
+        columns: DataFrame 的列名序列。
+    """
+    return _compile_columns(tuple(columns))
+
+
+def validate_mapping(map_df: pd.DataFrame, scm_columns=None) -> List[str]:
+    """
+    校验映射表，返回需要用户处理的问题描述列表（为空表示通过）。
+
+    检查项：映射表中重复的目标字段；映射表第二列（SCM字段）中、SCM数据里不存在的源字段
+    （只在传入 scm_columns 时检查）。规则表中定义了格式、但映射表中没有的字段多为派生字段，只记录日志。
+
+    Args:
+        map_df (pd.DataFrame): 映射关系表。
+        scm_columns: 已加载的SCM数据的列名；为 None 时不检查源字段。
+    """
+    if map_df is None or map_df.empty:
+        return []
+
+    issues = []
+    target_fields = map_df.iloc[:, 0].dropna().astype(str)
+
+    duplicated = target_fields[target_fields.duplicated()].unique().tolist()
+    if duplicated:
+        issues.append(f"映射表中存在重复的目标字段: {', '.join(duplicated)}")
+
+    if scm_columns is not None and map_df.shape[1] > 1:
+        available = set(map(str, scm_columns))
+        mapped = map_df.dropna(subset=[map_df.columns[0], map_df.columns[1]])
+        absent = [field for field in mapped.iloc[:, 1].astype(str).unique() if field not in available]
+        if absent:
+            issues.append(f"以下映射的SCM字段在新品申报数据中不存在，对应目标字段将为空: {', '.join(absent)}")
+
+    present = set(target_fields)
+    unformatted = [column for column in COLUMN_SCHEMA if column not in present]
+    if unformatted:
+        logger.info(f"映射表中没有以下已定义格式的字段: {', '.join(unformatted)}")
+
+    return issues
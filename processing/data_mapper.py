@@ -1,8 +1,151 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+import numpy as np
 import pandas as pd
 
+# 源数据类型 -> 映射表中对应源字段所在的列号
+SOURCE_FIELD_COLUMNS = {'table2': 1, 'table3': 2}
+# 进程内缓存的映射计划数量（每个映射表版本一个）
+_PLAN_CACHE_SIZE = 8
+_PLANS: "OrderedDict[str, MappingPlan]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _source_field_col_idx(source_type: str) -> int:
+    if source_type not in SOURCE_FIELD_COLUMNS:
+        raise ValueError("source_type 必须是 'table2' 或 'table3'")
+    return SOURCE_FIELD_COLUMNS[source_type]
+
+
+class MappingPlan:
+    """
+    由映射表编译出的映射计划，每个映射表版本只编译一次。
+    对 table2/table3 分别保存 源字段 -> 目标字段 的对应数组，以及最终的目标列顺序；
+    应用时按源数据的列顺序解析出列位置（同一列结构只解析一次），一次取列、一次性补齐缺失列。
+    """
+
+    def __init__(self, map_df: pd.DataFrame):
+        # 所有目标字段（去重后保持映射表中的顺序），也是结果的列顺序
+        self.target_fields: List[str] = map_df.iloc[:, 0].dropna().astype(str).unique().tolist()
+        # {源数据类型: (源字段数组, 目标字段数组)}，与 dict(zip(源字段, 目标字段)) 的键顺序及取值一致
+        self.fields: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for source_type, col_idx in SOURCE_FIELD_COLUMNS.items():
+            if map_df.shape[1] <= col_idx:
+                continue
+            map_df_clean = map_df.dropna(subset=[map_df.columns[0], map_df.columns[col_idx]], how='any')
+            field_map = dict(zip(map_df_clean.iloc[:, col_idx].astype(str), map_df_clean.iloc[:, 0].astype(str)))
+            self.fields[source_type] = (
+                np.array(list(field_map.keys()), dtype=object),
+                np.array(list(field_map.values()), dtype=object),
+            )
+        # {(源数据类型, 源数据列名元组): (取列位置, 取出列的目标名, 缺失的目标字段, 最终列顺序)}
+        self._layouts = {}
+
+    @staticmethod
+    def tag(map_df: pd.DataFrame, content_hash: str) -> pd.DataFrame:
+        """
+        在 attrs 中记录映射表的内容指纹（如上传文件的 SHA-256、已保存版本清单中的 content_hash），
+        之后 fingerprint 直接使用，不再逐行计算。同时记录形状，避免由它派生的子集沿用同一指纹。
+        """
+        map_df.attrs['content_hash'] = content_hash
+        map_df.attrs['content_shape'] = map_df.shape
+        return map_df
+
+    @staticmethod
+    def fingerprint(map_df: pd.DataFrame) -> str:
+        """
+        映射表内容的指纹，作为映射计划的缓存键。
+        优先使用 attrs 中已记录的指纹；没有时按内容计算一次并记入 attrs，
+        同一个映射表（及其副本）之后的映射不再重复计算。
+        """
+        recorded = map_df.attrs.get('content_hash')
+        if recorded is not None and map_df.attrs.get('content_shape') == map_df.shape:
+            return recorded
+        digest = hashlib.sha256(repr(list(map_df.columns)).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(map_df.astype(str), index=False).to_numpy().tobytes())
+        MappingPlan.tag(map_df, digest.hexdigest())
+        return map_df.attrs['content_hash']
+
+    @staticmethod
+    def for_mapping(map_df: pd.DataFrame) -> "MappingPlan":
+        """返回映射表对应的映射计划，同一内容的映射表只编译一次。"""
+        key = MappingPlan.fingerprint(map_df)
+        with _LOCK:
+            plan = _PLANS.get(key)
+            if plan is not None:
+                _PLANS.move_to_end(key)
+                return plan
+        plan = MappingPlan(map_df)
+        with _LOCK:
+            _PLANS[key] = plan
+            while len(_PLANS) > _PLAN_CACHE_SIZE:
+                _PLANS.popitem(last=False)
+        return plan
+
+    def source_fields(self, source_type: str) -> List[str]:
+        """指定源数据类型需要的源字段名。"""
+        _source_field_col_idx(source_type)
+        if source_type not in self.fields:
+            return []
+        return self.fields[source_type][0].tolist()
+
+    def _layout(self, source_type: str, columns: pd.Index):
+        key = (source_type, tuple(columns))
+        layout = self._layouts.get(key)
+        if layout is not None:
+            return layout
+
+        sources, targets = self.fields.get(source_type, (np.array([], dtype=object), np.array([], dtype=object)))
+        # 按源字段在映射中的顺序取列；源数据中同名列全部保留
+        positions, taken_targets = [], []
+        for source, target in zip(sources, targets):
+            if source in columns:
+                matched = columns.get_indexer_for([source])
+                positions.extend(matched.tolist())
+                taken_targets.extend([target] * len(matched))
+
+        present = set(taken_targets)
+        missing = [target for target in self.target_fields if target not in present]
+        # 最终列顺序：按目标字段顺序排列，同一目标字段对应多列时保持取列顺序
+        combined = taken_targets + missing
+        order = [pos for target in self.target_fields for pos, name in enumerate(combined) if name == target]
+        layout = (positions, taken_targets, missing, order)
+        self._layouts[key] = layout
+        return layout
+
+    def apply(self, source_df: pd.DataFrame, source_type: str) -> pd.DataFrame:
+        """把源数据映射为目标字段结构，缺失的目标字段填充空字符串。"""
+        _source_field_col_idx(source_type)
+        positions, taken_targets, missing, order = self._layout(source_type, source_df.columns)
+
+        taken = source_df.iloc[:, positions]
+        taken.columns = taken_targets
+        if missing:
+            filler = pd.DataFrame(
+                np.full((len(source_df), len(missing)), '', dtype=object), index=source_df.index, columns=missing
+            )
+            taken = pd.concat([taken, filler], axis=1)
+        return taken.iloc[:, order]
+
+
 class MappingProcessor:
     """映射处理类，负责字段映射逻辑"""
 
+    @staticmethod
+    def source_fields(map_df: pd.DataFrame, source_type: str = 'table2') -> List[str]:
+        """
+        返回映射表中指定源数据类型需要的源字段名（映射时只会保留这些列）。
+        Args:
+            map_df: 映射关系表（包含三列：目标字段名、table2字段名、table3字段名）
+            source_type: 源数据类型 ('table2' 或 'table3')
+        """
+        _source_field_col_idx(source_type)
+        if map_df.empty:
+            return []
+        return MappingPlan.for_mapping(map_df).source_fields(source_type)
+
     @staticmethod
     def run_mapping(map_df: pd.DataFrame, source_df: pd.DataFrame, source_type: str = 'table2') -> pd.DataFrame:
         """
@@ -15,34 +158,6 @@ class MappingProcessor:
         if map_df.empty or source_df.empty:
             return pd.DataFrame()
 
-        # 根据source_type选择对应的映射列
-        if source_type == 'table2':
-            source_field_col_idx = 1  # table2字段名在第二列
-        elif source_type == 'table3':
-            source_field_col_idx = 2  # table3字段名在第三列
-        else:
-            raise ValueError("source_type 必须是 'table2' 或 'table3'")
-
-        # 清理映射表并提取映射关系
-        map_df_clean = map_df.dropna(subset=[map_df.columns[0], map_df.columns[source_field_col_idx]], how='any')
-        
-        target_fields = map_df_clean.iloc[:, 0].astype(str)
-        source_fields = map_df_clean.iloc[:, source_field_col_idx].astype(str)
-        
-        # 构建映射字典 {源字段: 目标字段}
-        field_map = dict(zip(source_fields, target_fields))
-        
-        # 从 source_df 中选取并重命名存在的列
-        available_cols = [col for col in field_map if col in source_df.columns]
-        result_df = source_df[available_cols].rename(columns=field_map)
-        
-        # 添加在源数据中缺失但在映射表中定义的目标列，并填充为空
-        all_target_fields = map_df.iloc[:, 0].dropna().astype(str).unique()
-        for col in all_target_fields:
-            if col not in result_df.columns:
-                result_df[col] = ''
-        
-        # 确保最终结果的列顺序与映射表中的目标字段顺序一致
-        final_columns = [col for col in all_target_fields if col in result_df.columns]
-        
-        return result_df[final_columns]
+        # 根据source_type选择对应的映射列，并按映射表版本复用已编译的映射计划
+        _source_field_col_idx(source_type)
+        return MappingPlan.for_mapping(map_df).apply(source_df, source_type)
@@ -1,36 +1,153 @@
 import pandas as pd
 import numpy as np
+from config import MERGE_ENGINE, PROGRESS_INTERVAL_ROWS, setup_logging
+from utils.jobs import JobProgress
+from . import key_types
+
+logger = setup_logging()
 
 class DataMerger:
     """数据合并处理器，负责合并映射后的数据并排序"""
 
     @staticmethod
-    def merge_and_sort_data(map_scm_df: pd.DataFrame, map_benchmark_df: pd.DataFrame, strategy: str) -> pd.DataFrame:
+    def progress_name(strategy: str) -> str:
+        """合并进度在 JobProgress 中的计数名称（按已处理的SCM行数计）。"""
+        return f"合并[{'统采' if strategy == '统采' else '地采'}]新品行"
+
+    @staticmethod
+    def _sort_spec(strategy: str):
+        """返回指定采购模式下对标品组内的排序键与排序方向。"""
+        if strategy != '统采':
+            return ['取数维度（战区/集团）', '商品名称', '近90天月均销售数量'], [False, False, False]
+        return ['取数维度（战区/集团）', '近90天月均销售数量'], [False, False]
+
+    @staticmethod
+    def merge_and_sort_data(map_scm_df: pd.DataFrame, map_benchmark_df: pd.DataFrame, strategy: str, engine: str = MERGE_ENGINE, progress: JobProgress = None) -> pd.DataFrame:
         """
         根据复杂的分组、筛选和排序规则合并SCM和对标品数据。
-        
+
         Args:
             map_scm_df (pd.DataFrame): 映射后的SCM数据。
             map_benchmark_df (pd.DataFrame): 映射后的对标品数据。
             strategy (str): 采购模式策略 ('统采' 或 '地采')。
+            engine (str): 合并引擎 ('grouped' 或 'legacy')，'legacy' 仅用于与旧实现核对结果。
+            progress (JobProgress): 后台任务的进度，按已处理的SCM行数更新；任务取消时在循环中抛出 JobCancelled。
         """
-        if map_scm_df.empty:
-            return map_benchmark_df
-        if map_benchmark_df.empty:
-            return map_scm_df
+        if engine not in ('grouped', 'legacy'):
+            raise ValueError("engine 必须是 'grouped' 或 'legacy'")
 
-        # 为数据添加来源标记
+        # 为数据添加来源标记；任一方为空时也要保留，插入分隔行与导出时据此定位SCM行
         scm_df = map_scm_df.copy()
         scm_df['__source__'] = 'scm'
         benchmark_df = map_benchmark_df.copy()
         benchmark_df['__source__'] = 'benchmark'
-        
+
+        if map_scm_df.empty:
+            return benchmark_df
+        if map_benchmark_df.empty:
+            return scm_df
+
         if '近90天月均销售数量' in benchmark_df.columns:
             benchmark_df['近90天月均销售数量'] = pd.to_numeric(benchmark_df['近90天月均销售数量'], errors='coerce').fillna(0)
 
+        progress = progress or JobProgress()
+        if engine == 'grouped':
+            try:
+                return DataMerger._merge_grouped(scm_df, benchmark_df, strategy, progress)
+            except TypeError as e:
+                # 排序键中混有无法相互比较的类型时，整体排序会失败，退回逐行实现
+                logger.warning(f"分组合并引擎排序失败，回退至旧实现: {e}")
+
+        return DataMerger._merge_legacy(scm_df, benchmark_df, strategy, progress)
+
+    @staticmethod
+    def _merge_grouped(scm_df: pd.DataFrame, benchmark_df: pd.DataFrame, strategy: str, progress: JobProgress) -> pd.DataFrame:
+        """
+        向量化合并：对标品只整体排序、分组一次，最终通过一次行号数组取数完成交错拼接。
+        多列排序是稳定排序，因此从整体排好序的结果中按组截取，与逐组单独排序的顺序完全一致。
+        """
+        benchmark_df = benchmark_df.reset_index(drop=True)
+        n_scm = len(scm_df)
+        is_dicai = strategy != '统采'
+
+        # 0. 键列为分类类型时统一两侧的类别字典，分组与筛选直接比较整数编码（空值编码为 -1）
+        category_keys = key_types.align_categorical(scm_df['三级大类'], benchmark_df['三级大类'])
+        if category_keys is not None:
+            scm_df['三级大类'], benchmark_df['三级大类'] = category_keys
+            scm_categories, benchmark_categories = (key.cat.codes.to_numpy() for key in category_keys)
+            scm_missing = scm_categories < 0
+        else:
+            scm_categories = scm_df['三级大类'].to_numpy(dtype=object)
+            benchmark_categories = benchmark_df['三级大类'].to_numpy()
+            scm_missing = pd.isna(scm_categories)
+
+        # 1. 预先计算对标品的整体排序（分类键的类别按字典序排列，排序结果与字符串列一致）
+        sort_keys, ascending = DataMerger._sort_spec(strategy)
+        if all(key in benchmark_df.columns for key in sort_keys):
+            order = benchmark_df.sort_values(by=sort_keys, ascending=ascending).index.to_numpy()
+        else:
+            order = np.arange(len(benchmark_df))
+
+        # 2. 按三级大类预分组，组内行号已是排好序的顺序
+        sorted_categories = benchmark_categories[order]
+        category_groups = pd.Series(order).groupby(sorted_categories, sort=False).indices
+        category_groups = {key: order[pos] for key, pos in category_groups.items()}
+
+        if is_dicai:
+            zone_keys = key_types.align_categorical(
+                scm_df['提报战区'], benchmark_df['取数维度（战区/集团）'], extra=['集团']
+            )
+            if zone_keys is not None:
+                scm_zones, dimensions = (key.cat.codes.to_numpy() for key in zone_keys)
+                group_zone = zone_keys[0].cat.categories.get_loc('集团')
+                scm_zone_missing = scm_zones < 0
+            else:
+                dimensions = benchmark_df['取数维度（战区/集团）'].to_numpy(dtype=object)
+                scm_zones = scm_df['提报战区'].to_numpy(dtype=object)
+                group_zone = '集团'
+                scm_zone_missing = pd.isna(scm_zones)
+        zone_groups = {}
+
+        # 3. 生成交错的行号数组：SCM 行取自前 n_scm 行，对标品行整体偏移 n_scm
+        counter = DataMerger.progress_name(strategy)
+        parts = []
+        for scm_pos, category in enumerate(scm_categories):
+            if scm_pos % PROGRESS_INTERVAL_ROWS == 0:
+                progress.report(counter, scm_pos, n_scm)
+            parts.append(np.array([scm_pos]))
+            if scm_missing[scm_pos] or category not in category_groups:
+                continue
+
+            group_rows = category_groups[category]
+            if is_dicai:
+                # 地采逻辑：同一(三级大类, 提报战区)组合只筛选一次
+                zone = None if scm_zone_missing[scm_pos] else scm_zones[scm_pos]
+                zone_key = (category, zone)
+                if zone_key not in zone_groups:
+                    group_dims = dimensions[group_rows]
+                    condition = group_dims == group_zone
+                    if zone is not None:
+                        condition |= group_dims == zone
+                    zone_groups[zone_key] = group_rows[condition]
+                group_rows = zone_groups[zone_key]
+
+            if len(group_rows):
+                parts.append(group_rows + n_scm)
+
+        combined = pd.concat([scm_df, benchmark_df], ignore_index=True)
+        merged = combined.take(np.concatenate(parts)).reset_index(drop=True)
+        progress.report(counter, n_scm, n_scm)
+        return merged
+
+    @staticmethod
+    def _merge_legacy(scm_df: pd.DataFrame, benchmark_df: pd.DataFrame, strategy: str, progress: JobProgress) -> pd.DataFrame:
+        """逐行遍历的旧合并实现，保留用于核对分组合并引擎的结果。"""
         all_parts = []
-        
-        for index, scm_row in scm_df.iterrows():
+        counter = DataMerger.progress_name(strategy)
+
+        for scm_pos, (index, scm_row) in enumerate(scm_df.iterrows()):
+            if scm_pos % PROGRESS_INTERVAL_ROWS == 0:
+                progress.report(counter, scm_pos, len(scm_df))
             current_scm_part = scm_row.to_frame().T
             all_parts.append(current_scm_part)
 
@@ -41,7 +158,7 @@ class DataMerger:
             current_benchmark_base = benchmark_df[benchmark_df['三级大类'] == category]
             if current_benchmark_base.empty:
                 continue
-            
+
             # --- 核心修复：使用传入的 strategy 参数 ---
             final_benchmark_group = pd.DataFrame()
             if strategy != '统采':
@@ -55,27 +172,20 @@ class DataMerger:
             else:
                 # 统采逻辑
                 final_benchmark_group = current_benchmark_base
-            
+
             if not final_benchmark_group.empty:
-                if strategy != '统采':
-                    sort_keys = ['取数维度（战区/集团）', '商品名称','近90天月均销售数量']
-                    if all(key in final_benchmark_group.columns for key in sort_keys):
-                        final_benchmark_group = final_benchmark_group.sort_values(
-                            by=sort_keys,
-                            ascending=[False, False, False]
-                        )
-                else:
-                    sort_keys = ['取数维度（战区/集团）','近90天月均销售数量']
-                    if all(key in final_benchmark_group.columns for key in sort_keys):
-                        final_benchmark_group = final_benchmark_group.sort_values(
-                            by=sort_keys,
-                            ascending=[False, False]
-                        )
+                sort_keys, ascending = DataMerger._sort_spec(strategy)
+                if all(key in final_benchmark_group.columns for key in sort_keys):
+                    final_benchmark_group = final_benchmark_group.sort_values(
+                        by=sort_keys,
+                        ascending=ascending
+                    )
                 all_parts.append(final_benchmark_group)
 
         if not all_parts:
             return pd.DataFrame(columns=scm_df.columns)
 
         final_df = pd.concat(all_parts).reset_index(drop=True)
-        
+        progress.report(counter, len(scm_df), len(scm_df))
+
         return final_df
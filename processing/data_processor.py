@@ -6,21 +6,59 @@ class DataProcessor:
     负责在数据合并后进行高级处理，例如插入分组的分隔行。
     """
 
+    SEPARATOR_PLACEHOLDER = "_SEPARATOR_"
+
     @staticmethod
-    def insert_group_separators(merged_df: pd.DataFrame):
+    def insert_group_separators(merged_df: pd.DataFrame, engine: str = 'vectorized'):
         """
         在每个SCM物料组前插入一个空的分隔行。
         简化版：通过识别 '__source__' 列来定位SCM数据行的起始位置。
+
+        Args:
+            merged_df (pd.DataFrame): 合并排序后的数据。
+            engine (str): 'vectorized' 一次性计算所有行的最终位置；'legacy' 为逐个插入的旧实现。
         """
+        if engine not in ('vectorized', 'legacy'):
+            raise ValueError("engine 必须是 'vectorized' 或 'legacy'")
+
         if merged_df.empty or '__source__' not in merged_df.columns:
             return merged_df, [], []
 
+        if engine == 'legacy':
+            return DataProcessor._insert_group_separators_legacy(merged_df)
+
+        # 1. 识别出所有 SCM 数据行（每个 SCM 行之前都要插入一个分隔行）
+        is_scm_mask = (merged_df['__source__'] == 'scm').to_numpy()
+        if not is_scm_mask.any():
+            return merged_df, [], []
+
+        # 2. 直接计算每一行的新位置：原位置 + 截至该行(含)的 SCM 行数
+        n_rows = len(merged_df)
+        new_positions = np.arange(n_rows) + np.cumsum(is_scm_mask)
+        final_scm_indices = new_positions[is_scm_mask]
+        final_separator_indices = final_scm_indices - 1
+
+        # 3. 构造取数数组：分隔行统一指向追加在末尾的占位行，一次 take 完成拼接
+        indexer = np.full(n_rows + len(final_scm_indices), n_rows)
+        indexer[new_positions] = np.arange(n_rows)
+
+        separator_row = pd.DataFrame(
+            [[DataProcessor.SEPARATOR_PLACEHOLDER] * len(merged_df.columns)],
+            columns=merged_df.columns
+        )
+        new_df = pd.concat([merged_df, separator_row], ignore_index=True).take(indexer).reset_index(drop=True)
+
+        return new_df, final_separator_indices.tolist(), final_scm_indices.tolist()
+
+    @staticmethod
+    def _insert_group_separators_legacy(merged_df: pd.DataFrame):
+        """逐个切片插入分隔行的旧实现，保留用于结果核对与性能对比。"""
         # 1. 识别出所有 SCM 数据行
         is_scm_mask = (merged_df['__source__'] == 'scm')
 
         # 2. 找到 SCM 数据块的起始位置
         # 逻辑：当前行是 SCM 行
-        is_group_start = is_scm_mask 
+        is_group_start = is_scm_mask
         insert_indices = merged_df[is_group_start].index.tolist()
 
         if not insert_indices:
@@ -29,15 +67,15 @@ class DataProcessor:
 
         # 3. 倒序插入分隔行
         new_df = merged_df.copy()
-        separator_placeholder = "_SEPARATOR_"
-        
+        separator_placeholder = DataProcessor.SEPARATOR_PLACEHOLDER
+
         for index in reversed(insert_indices):
             separator_row = pd.DataFrame([{col: separator_placeholder for col in new_df.columns}], index=[index - 0.5])
             new_df = pd.concat([new_df.iloc[:index], separator_row, new_df.iloc[index:]]).reset_index(drop=True)
 
         # 4. 重新计算分隔行和 SCM 行的最终索引
         final_separator_indices = new_df[new_df.iloc[:, 0] == separator_placeholder].index.tolist()
-        
+
         new_is_scm_mask = (new_df['__source__'] == 'scm')
         final_scm_indices = new_df[new_is_scm_mask].index.tolist()
 
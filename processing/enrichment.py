@@ -0,0 +1,78 @@
+"""
+SCM数据读入后、进入各采购模式策略之前的基础处理：按需读取列，并关联国家医保目录。
+Streamlit 应用与命令行批处理共用。
+"""
+
+from typing import Optional, Set
+import pandas as pd
+from config import NATIONAL_DIR_SQL_FILE, NATIONAL_DIR_TABLE, NATIONAL_DIR_CACHE_TTL, SCM_KEY_COLUMNS
+from db.database_handler import SQLProcessor
+from db.query_cache import QueryCache
+from utils.file_handler import FileProcessor
+from utils.reporter import Reporter
+from .data_mapper import MappingProcessor
+from . import key_types
+
+# 读取SCM文件时按文本读取的编码列
+SCM_DTYPE_SPEC = {'过会编码': str, '新品编码': str, '商品编码': str, '国际条码': str, '国家药品编码': str}
+
+
+class BaseDataEnricher:
+    """SCM数据的读取与基础信息关联，这是所有模式都需要的。"""
+
+    def __init__(self, sql_processor: SQLProcessor, national_dir_cache: QueryCache, reporter: Reporter = None):
+        self.sql_processor = sql_processor
+        self.national_dir_cache = national_dir_cache
+        self.reporter = reporter or Reporter()
+
+    @staticmethod
+    def scm_columns(map_df: Optional[pd.DataFrame]) -> Optional[Set[str]]:
+        """返回读取SCM文件时需要的列；未加载映射表时返回 None（读取全部列）。"""
+        if map_df is None or map_df.empty:
+            return None
+        return set(MappingProcessor.source_fields(map_df, source_type='table2')) | set(SCM_KEY_COLUMNS)
+
+    @staticmethod
+    def read_scm(file_path_or_buffer, map_df: Optional[pd.DataFrame]) -> pd.DataFrame:
+        """读取SCM文件（只解析映射表与后续流程用到的列），键列随即类型化。"""
+        scm_df = FileProcessor.read_excel_safe(
+            file_path_or_buffer, dtype_spec=SCM_DTYPE_SPEC, usecols=BaseDataEnricher.scm_columns(map_df)
+        )
+        parse_stats = scm_df.attrs.get('parse_stats')
+        scm_df = key_types.categorize(scm_df)
+        scm_df.attrs['parse_stats'] = parse_stats
+        return scm_df
+
+    def enrich(self, scm_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        对SCM数据进行基础信息关联，例如国家医保目录。
+        关联成功时结果的 attrs['national_dir_joined'] 为 True。
+        """
+        current_df = scm_df.copy()
+
+        # --- 关联国家医保目录 ---
+        try:
+            if NATIONAL_DIR_SQL_FILE.exists():
+                sql_query = self.sql_processor.read_sql_file(NATIONAL_DIR_SQL_FILE)
+                national_dir_df, _ = self.sql_processor.execute_cached_query(
+                    sql_query, NATIONAL_DIR_TABLE, self.national_dir_cache, NATIONAL_DIR_CACHE_TTL
+                )
+
+                if not national_dir_df.empty and '国家药品编码' in current_df.columns and '国家药品编码' in national_dir_df.columns:
+                    current_df['国家药品编码'], national_dir_df['国家药品编码'] = key_types.join_keys(
+                        current_df['国家药品编码'], national_dir_df['国家药品编码']
+                    )
+
+                    cols_to_replace = ['国家医保目录', '省医保目录', '省医保支付价']
+                    df_cleaned = current_df.drop(columns=[col for col in cols_to_replace if col in current_df.columns])
+
+                    current_df = pd.merge(df_cleaned, national_dir_df, on='国家药品编码', how='left')
+                    current_df.attrs['national_dir_joined'] = True
+                else:
+                    self.reporter.warning("⚠️ 无法关联国家医保目录（缺少关联键或查询为空）。")
+            else:
+                self.reporter.warning(f"⚠️ 未找到 '{NATIONAL_DIR_SQL_FILE}' 文件，医保目录信息将不会关联。")
+        except Exception as e:
+            self.reporter.error(f"❌ 关联国家医保目录时出错: {e}")
+
+        return current_df
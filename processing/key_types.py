@@ -0,0 +1,122 @@
+"""
+关联与分组键列的类型化（KEY_DTYPE_MODE='categorical'）。
+键列在读入后即转换为 pandas 分类类型，类别按字典序排列，排序结果与字符串列一致；
+SCM 与对标品两侧的同一键在关联/合并前统一为同一份类别字典，比较与关联都在整数编码上完成。
+只含字符串的列才会转换，混有数字等其他类型的列保持为对象列。
+"""
+
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype, infer_dtype
+from config import KEY_DTYPE_MODE
+
+# 需要类型化的键列
+KEY_COLUMNS = ('三级大类', '取数维度（战区/集团）', '提报战区', '通用名', '策略分类', '采购公司', '国家药品编码')
+
+
+def enabled() -> bool:
+    if KEY_DTYPE_MODE not in ('categorical', 'object'):
+        raise ValueError("KEY_DTYPE_MODE 必须是 'categorical' 或 'object'")
+    return KEY_DTYPE_MODE == 'categorical'
+
+
+def _string_categories(values: Iterable) -> Optional[pd.Index]:
+    """返回去重并按字典序排列的类别；含非字符串值时返回 None。"""
+    categories = pd.Index(pd.unique(np.asarray(list(values), dtype=object)), dtype=object)
+    categories = categories[categories.notna()]
+    if len(categories) and infer_dtype(categories, skipna=False) != 'string':
+        return None
+    return categories.sort_values()
+
+
+def _categories_of(series: pd.Series) -> Optional[pd.Index]:
+    if isinstance(series.dtype, CategoricalDtype):
+        return _string_categories(series.cat.categories)
+    if series.dtype == object:
+        return _string_categories(series.dropna().unique())
+    return None
+
+
+def categorize(df: pd.DataFrame, columns: Iterable[str] = KEY_COLUMNS) -> pd.DataFrame:
+    """把 df 中存在的键列转换为分类类型（未开启类型化时原样返回）。"""
+    if not enabled():
+        return df
+    converted = {}
+    for col in columns:
+        if col not in df.columns or df.columns.get_indexer_for([col]).size != 1:
+            continue
+        series = df[col]
+        if isinstance(series.dtype, CategoricalDtype):
+            continue
+        categories = _categories_of(series)
+        if categories is not None:
+            converted[col] = series.astype(CategoricalDtype(categories))
+    if not converted:
+        return df
+    return df.assign(**converted)
+
+
+def from_chunks(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    分块读取累积的结果中文本列为分类类型（类别按出现顺序排列）：
+    键列改为按字典序排列类别的分类类型，未开启类型化或含非字符串值时还原为对象列；其余分类列还原为对象列。
+    """
+    converted = {}
+    for col, dtype in df.dtypes.items():
+        if not isinstance(dtype, CategoricalDtype) or df.columns.get_indexer_for([col]).size != 1:
+            continue
+        categories = _string_categories(dtype.categories) if col in KEY_COLUMNS and enabled() else None
+        if categories is None:
+            converted[col] = df[col].astype(object)
+        elif not dtype.categories.equals(categories):
+            converted[col] = df[col].cat.reorder_categories(categories)
+    if not converted:
+        return df
+    return df.assign(**converted)
+
+
+def shared_dtype(*series: pd.Series, extra: Iterable[str] = ()) -> Optional[CategoricalDtype]:
+    """各列（及 extra 中的值）的类别并集组成的分类类型；任一列含非字符串值时返回 None。"""
+    parts = []
+    for item in series:
+        categories = _categories_of(item)
+        if categories is None:
+            return None
+        parts.append(categories)
+    categories = _string_categories([value for part in parts for value in part] + list(extra))
+    if categories is None:
+        return None
+    return CategoricalDtype(categories)
+
+
+def align(*series: pd.Series, extra: Iterable[str] = ()) -> Optional[List[pd.Series]]:
+    """把各列转换为同一份类别字典（未开启类型化或无法统一时返回 None）。"""
+    if not enabled():
+        return None
+    dtype = shared_dtype(*series, extra=extra)
+    if dtype is None:
+        return None
+    return [item if item.dtype == dtype else item.astype(dtype) for item in series]
+
+
+def join_keys(left: pd.Series, right: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    关联键：两侧按字符串比较（与 astype(str) 的结果一致，空值为 'nan'），
+    开启类型化时再统一为同一份类别字典，pd.merge 直接按整数编码关联。
+    """
+    left, right = left.astype(str), right.astype(str)
+    aligned = align(left, right)
+    if aligned is None:
+        return left, right
+    return aligned[0], aligned[1]
+
+
+def align_categorical(*series: pd.Series, extra: Iterable[str] = ()) -> Optional[List[pd.Series]]:
+    """
+    只在各列都已是分类类型时把它们统一为同一份类别字典，调用方可直接比较 .cat.codes（空值为 -1）；
+    否则返回 None，由调用方按对象列处理。
+    """
+    if not all(isinstance(item.dtype, CategoricalDtype) for item in series):
+        return None
+    return align(*series, extra=extra)
@@ -1,29 +1,78 @@
 """
 定义了分析流程的执行器 (Pipeline)。
-它会根据传入的采购模式，自动选择并执行正确的分析策略。
+它会根据采购模式，自动选择并执行正确的分析策略。
 这是策略模式的上下文 (Context) 部分。
+
+未指定采购模式时按每行的 采购模式 拆分SCM数据：只有一种采购模式时与指定该模式相同；
+地采、统采混合时两种策略共用一次对标品查询（SharedBenchmarkFetch），在线程中并行生成结果表，
+再导出为同一个工作簿中的两个工作表。
 """
 
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from typing import Dict, List, Optional, Tuple
 import pandas as pd
+from utils.reporter import Reporter, QueuedReporter
+from .shared_fetch import SharedBenchmarkFetch
 from .strategies import AnalysisStrategy, DicaiStrategy, TongcaiStrategy
 
+PURCHASE_MODE_COLUMN = '采购模式'
+
+
 class AnalysisPipeline:
     """分析流程的执行器。"""
 
-    def __init__(self, purchase_mode: str, processors: dict):
+    def __init__(self, purchase_mode: Optional[str], processors: dict):
         """
         根据采购模式选择合适的策略。
 
         Args:
-            purchase_mode (str): 采购模式 ('统采' 或 '地采')。
+            purchase_mode (str): 采购模式 ('统采' 或 '地采')；None 表示按每行的采购模式分别处理。
             processors (dict): 包含所有处理器实例的字典。
         """
         self.processors = processors
-        
+        self.strategy: Optional[AnalysisStrategy] = None
+        if purchase_mode is not None:
+            self.strategy = self.strategy_for(purchase_mode, processors)
+
+    @staticmethod
+    def strategy_for(purchase_mode: str, processors: dict) -> AnalysisStrategy:
         if purchase_mode == '统采':
-            self.strategy: AnalysisStrategy = TongcaiStrategy(self.processors)
-        else: # 默认为地采
-            self.strategy: AnalysisStrategy = DicaiStrategy(self.processors)
+            return TongcaiStrategy(processors)
+        # 默认为地采
+        return DicaiStrategy(processors)
+
+    @staticmethod
+    def purchase_mode_of(scm_df: pd.DataFrame) -> str:
+        """取SCM数据中第一个非空的采购模式，缺失时默认为地采。"""
+        if PURCHASE_MODE_COLUMN in scm_df.columns and not scm_df[PURCHASE_MODE_COLUMN].dropna().empty:
+            return scm_df[PURCHASE_MODE_COLUMN].dropna().iloc[0]
+        return "地采"
+
+    @staticmethod
+    def partition(scm_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """
+        按每行的采购模式拆分SCM数据，返回 {'地采'/'统采': 对应的行}（只含有数据的模式，地采在前）。
+        采购模式为空的行沿用第一个非空的采购模式；'统采' 以外的取值按地采处理。
+        只有一种采购模式时原样返回整个 DataFrame。
+        """
+        default = '统采' if AnalysisPipeline.purchase_mode_of(scm_df) == '统采' else '地采'
+        if PURCHASE_MODE_COLUMN not in scm_df.columns:
+            return {default: scm_df}
+        modes = scm_df[PURCHASE_MODE_COLUMN].astype(object)
+        is_tongcai = (modes == '统采') | (modes.isna() & (default == '统采'))
+        if is_tongcai.all() or not is_tongcai.any():
+            return {default: scm_df}
+        return {
+            '地采': scm_df[~is_tongcai].reset_index(drop=True),
+            '统采': scm_df[is_tongcai].reset_index(drop=True),
+        }
+
+    def benchmark_jobs(self, scm_df: pd.DataFrame) -> List[Tuple[AnalysisStrategy, pd.DataFrame]]:
+        """[(策略, 该策略处理的SCM行)]，供 SharedBenchmarkFetch 合并对标品查询条件。"""
+        if self.strategy is not None:
+            return [(self.strategy, scm_df)]
+        return [(self.strategy_for(mode, self.processors), part) for mode, part in self.partition(scm_df).items()]
 
     def run(self, map_df: pd.DataFrame, scm_df: pd.DataFrame) -> dict:
         """
@@ -34,6 +83,68 @@ class AnalysisPipeline:
             scm_df (pd.DataFrame): SCM新品申报数据。
 
         Returns:
-            dict: 包含处理结果的字典。
+            dict: 包含处理结果的字典；混合采购模式时另有 result_sheets（{采购模式: 结果表}）与 purchase_modes（{采购模式: SCM行数}）。
         """
-        return self.strategy.execute(map_df, scm_df)
+        if self.strategy is not None:
+            return self.strategy.execute(map_df, scm_df)
+        parts = self.partition(scm_df)
+        if len(parts) == 1:
+            (mode, part), = parts.items()
+            return self.strategy_for(mode, self.processors).execute(map_df, part)
+        return self._run_mixed(map_df, parts)
+
+    def _run_mixed(self, map_df: pd.DataFrame, parts: Dict[str, pd.DataFrame]) -> dict:
+        """地采、统采两部分共用一次对标品查询，并行生成结果表后导出为一个工作簿。"""
+        reporter = self.processors.get("reporter") or Reporter()
+        status_updater = self.processors.get("status_updater", reporter.status)
+        status_updater(
+            label=f"🔀 检测到混合采购模式（{'，'.join(f'{mode} {len(part)} 行' for mode, part in parts.items())}），正在合并查询对标品数据…",
+            state="running"
+        )
+        shared = SharedBenchmarkFetch(self.processors["sql"], map_df)
+        # 提取查询条件时的提示信息在各部分运行时还会给出，这里不重复显示
+        quiet_processors = {**self.processors, "reporter": Reporter()}
+        shared.fetch([(self.strategy_for(mode, quiet_processors), part) for mode, part in parts.items()])
+
+        # 工作线程的提示信息经队列转发，由当前线程更新状态
+        queue = Queue()
+
+        progress = self.processors.get("progress")
+
+        def prepare(mode: str, part: pd.DataFrame) -> dict:
+            worker_reporter = QueuedReporter(queue)
+
+            def worker_status(label: str, state: str = "running"):
+                # 阶段切换时检查后台任务是否已取消，不必等队列转发
+                if progress is not None:
+                    progress.check()
+                worker_reporter.status(label, state)
+
+            processors = {**self.processors, "reporter": worker_reporter, "status_updater": worker_status}
+            indexed_processor = shared.processor_for(part, worker_reporter)
+            if indexed_processor is not None:
+                processors["sql"] = indexed_processor
+            return self.strategy_for(mode, processors).prepare(map_df, part)
+
+        with ThreadPoolExecutor(max_workers=len(parts), thread_name_prefix="pipeline") as executor:
+            futures = {mode: executor.submit(prepare, mode, part) for mode, part in parts.items()}
+            while not all(future.done() for future in futures.values()):
+                QueuedReporter.drain(queue, reporter, status_updater, timeout=0.1)
+            QueuedReporter.drain(queue, reporter, status_updater)
+            prepared = {mode: future.result() for mode, future in futures.items()}
+
+        status_updater(label=f"📦 正在生成包含[{'、'.join(prepared)}]工作表的Excel文件…", state="running")
+        output, filename, export_stats = self.processors["exporter"].export_sheets(
+            [(mode, result["result_df"], result["separator_indices"], result["scm_indices"]) for mode, result in prepared.items()],
+            purchase_modes=list(prepared), progress=progress
+        )
+        return {
+            "result_df": pd.concat([result["result_df"] for result in prepared.values()], ignore_index=True),
+            "result_sheets": {mode: result["result_df"] for mode, result in prepared.items()},
+            "result_output": output,
+            "result_filename": filename,
+            "executed_sql": "\n\n".join(f"-- [{mode}]\n{result['executed_sql']}" for mode, result in prepared.items()),
+            "new_product_count": sum(len(result["scm_indices"]) for result in prepared.values()),
+            "export_stats": export_stats,
+            "purchase_modes": {mode: len(part) for mode, part in parts.items()},
+        }
@@ -0,0 +1,97 @@
+"""
+多个待处理任务（一批SCM文件，或同一上传中不同采购模式的部分）共用一次对标品查询：
+合并各任务的筛选条件并集后只取数一次，建立 BenchmarkIndex，
+各任务的策略再通过 IndexedSQLProcessor 从索引中取出自己的子集。
+"""
+
+from typing import List, Optional, Tuple
+import pandas as pd
+from config import setup_logging, BENCHMARK_FETCH_MODE
+from db.benchmark_index import BenchmarkIndex, IndexedSQLProcessor
+from db.query_builder import filter_zones
+from utils.reporter import Reporter
+from .data_mapper import MappingPlan, MappingProcessor
+from .strategies import AnalysisStrategy
+
+logger = setup_logging()
+
+LEV3_TARGET = '三级大类'
+
+
+class SharedBenchmarkFetch:
+    """为一组任务一次性取回对标品数据，并为每个任务提供从索引取数的查询处理器。"""
+
+    def __init__(self, sql_processor, map_df: pd.DataFrame):
+        """
+        Args:
+            sql_processor (SQLProcessor): 实际访问数据库的处理器。
+            map_df (pd.DataFrame): 映射关系表。
+        """
+        self.sql_processor = sql_processor
+        self.map_df = map_df
+        self.lev3_column = self._lev3_column(map_df)
+        self.frame: Optional[pd.DataFrame] = None
+        self.index: Optional[BenchmarkIndex] = None
+
+    @staticmethod
+    def _lev3_column(map_df: pd.DataFrame) -> Optional[str]:
+        """对标品数据中映射为 三级大类 的源列；没有或对应多列时返回 None。"""
+        plan = MappingPlan.for_mapping(map_df)
+        if 'table3' not in plan.fields:
+            return None
+        sources, targets = plan.fields['table3']
+        matched = sources[targets == LEV3_TARGET]
+        return matched[0] if len(matched) == 1 else None
+
+    def lev3_categories(self, scm_df: pd.DataFrame) -> Optional[list]:
+        """任务SCM数据映射后的三级大类取值；无法确定时返回 None（不按三级大类筛选）。"""
+        if self.lev3_column is None:
+            return None
+        mapped = MappingProcessor.run_mapping(self.map_df, scm_df, source_type='table2')
+        if mapped.columns.tolist().count(LEV3_TARGET) != 1:
+            return None
+        return mapped[LEV3_TARGET].dropna().unique().tolist()
+
+    def fetch(self, jobs: List[Tuple[AnalysisStrategy, pd.DataFrame]]) -> Optional[pd.DataFrame]:
+        """
+        按各任务筛选条件的并集取数一次并建立索引，返回取回的对标品行。
+        索引在这里一次建好，之后 processor_for 只读取，可在多个线程中同时调用。
+        流式读取模式、有任务不按战区筛选或无法提取条件时，并集无法覆盖所有任务，不做共享取数并返回 None。
+        查询处理器本身已从共享取回的数据中取数（如批处理中的混合采购模式文件）时，直接沿用，同样返回 None。
+        """
+        if not jobs or BENCHMARK_FETCH_MODE == 'streaming' or isinstance(self.sql_processor, IndexedSQLProcessor):
+            return None
+
+        names, categories, zones = set(), set(), set()
+        for strategy, scm_df in jobs:
+            try:
+                filters = strategy.benchmark_filters(scm_df)
+            except Exception as e:
+                logger.warning(f"无法提取对标品查询条件，不共享取数: {e}")
+                return None
+            job_zones = filter_zones(filters["cgms"], filters["lev3_org_name"])
+            if not job_zones:
+                logger.info("有任务不按战区筛选，不共享取数。")
+                return None
+            names.update(map(str, filters["common_names"]))
+            categories.update(map(str, filters["strategy_categories"]))
+            zones.update(job_zones)
+
+        try:
+            self.frame = self.sql_processor.prefetch(
+                self.sql_processor.read_sql_file(AnalysisStrategy.BENCHMARK_SQL_FILE), sorted(names), sorted(categories), sorted(zones),
+                columns=MappingProcessor.source_fields(self.map_df, source_type='table3'),
+            )
+        except Exception as e:
+            # 共享取数失败不影响各任务单独查询
+            logger.warning(f"对标品共享取数失败，改为逐个任务查询: {e}")
+            self.frame = None
+            return None
+        self.index = BenchmarkIndex(self.frame, self.lev3_column)
+        return self.frame
+
+    def processor_for(self, scm_df: pd.DataFrame, reporter: Reporter = None) -> Optional[IndexedSQLProcessor]:
+        """返回任务使用的查询处理器；没有共享取数结果时返回 None（任务直接查询数据库）。"""
+        if self.index is None:
+            return None
+        return IndexedSQLProcessor(self.index, self.lev3_categories(scm_df), reporter)
@@ -5,33 +5,42 @@
 
 from abc import ABC, abstractmethod
 import pandas as pd
-import streamlit as st
-from config import NATIONAL_DIR_SQL_FILE, PURCHASE_CO_MAPPING_FILE
+from config import NATIONAL_DIR_SQL_FILE, PURCHASE_CO_MAPPING_FILE, BENCHMARK_FETCH_MODE
 from pathlib import Path
+from utils.resource_cache import load_cached
+from utils.reporter import Reporter
+from . import key_types
 
 
 class AnalysisStrategy(ABC):
     """分析策略的抽象基类，定义了所有策略必须遵循的接口。"""
 
+    # 对标品查询使用的SQL文件
+    BENCHMARK_SQL_FILE = Path("对标品.sql")
+    # 策略对应的采购模式（导出模板、文件名与工作表名）
+    PURCHASE_MODE = ''
+
     def __init__(self, processors):
         """
         初始化策略。
 
         Args:
-            processors (dict): 包含所有处理器实例的字典。
+            processors (dict): 包含所有处理器实例的字典；可选的 "reporter" 为提示信息的出口（默认只写日志），
+                可选的 "progress" (JobProgress) 为后台任务的进度，合并与导出时更新并检查是否已取消。
         """
+        self.reporter = processors.get("reporter") or Reporter()
         self.sql_processor = processors["sql"]
         self.mapping_processor = processors["mapper"]
         self.data_merger = processors["merger"]
         self.data_processor = processors["processor"]
         self.data_formatter = processors["formatter"]
         self.result_exporter = processors["exporter"]
-        self.status_updater = processors.get("status_updater", lambda label, state: None)
+        self.status_updater = processors.get("status_updater", self.reporter.status)
+        self.progress = processors.get("progress")
 
-    @abstractmethod
     def execute(self, map_df: pd.DataFrame, scm_df: pd.DataFrame) -> dict:
         """
-        执行完整的分析流程。
+        执行完整的分析流程：prepare 生成结果表后按本策略的模板导出Excel。
 
         Args:
             map_df (pd.DataFrame): 映射关系表。
@@ -40,12 +49,110 @@ class AnalysisStrategy(ABC):
         Returns:
             dict: 包含处理结果的字典，例如最终的DataFrame和导出的Excel文件。
         """
+        prepared = self.prepare(map_df, scm_df)
+        self.status_updater(label=f"📦 正在按[{self.PURCHASE_MODE}]模板生成Excel文件…", state="running")
+        output, filename, export_stats = self.result_exporter.export_to_excel(
+            prepared["result_df"], prepared["separator_indices"], prepared["scm_indices"], purchase_mode=self.PURCHASE_MODE,
+            progress=self.progress
+        )
+        return {
+            "result_df": prepared["result_df"],
+            "result_output": output,
+            "result_filename": filename,
+            "executed_sql": prepared["executed_sql"],
+            "new_product_count": len(prepared["scm_indices"]),
+            "export_stats": export_stats
+        }
+
+    @abstractmethod
+    def prepare(self, map_df: pd.DataFrame, scm_df: pd.DataFrame) -> dict:
+        """
+        查询、合并并格式化，生成待导出的结果表（不导出）。
+
+        Returns:
+            dict: result_df（格式化后的结果表）、separator_indices、scm_indices（导出参数）与 executed_sql。
+        """
         pass
 
+    @abstractmethod
+    def benchmark_filters(self, scm_df: pd.DataFrame) -> dict:
+        """
+        返回SCM数据对应的对标品查询条件。
+
+        Returns:
+            dict: execute_sql_query 的 cgms、common_names、strategy_categories、lev3_org_name 参数。
+        """
+        pass
+
+    def _fetch_benchmark(self, map_df: pd.DataFrame, map_scm_df: pd.DataFrame, cgms: str, common_names: list, strategy_categories: list, lev3_org_name: list = None):
+        """
+        查询对标品数据并完成映射。
+        流式读取模式(BENCHMARK_FETCH_MODE='streaming')下，映射与三级大类预筛选在逐块取数时完成，
+        只保留三级大类出现在SCM数据中的对标品行（合并时其余行不会被用到）。
+
+        Returns:
+            Tuple[pd.DataFrame, str]: 映射后的对标品数据，以及执行的SQL语句。
+        """
+        sql_query = self.sql_processor.read_sql_file(self.BENCHMARK_SQL_FILE)
+        chunk_transform = None
+        if BENCHMARK_FETCH_MODE == 'streaming':
+            scm_categories = set(map_scm_df['三级大类'].dropna()) if '三级大类' in map_scm_df.columns else None
+            # 各块预筛选后保留的行数（分块可能在多个线程中转换，list.append 是原子操作）
+            kept_counts = []
+
+            def chunk_transform(chunk_df: pd.DataFrame) -> pd.DataFrame:
+                mapped = self.mapping_processor.run_mapping(map_df, chunk_df, source_type='table3')
+                if scm_categories is not None and '三级大类' in mapped.columns:
+                    mapped = mapped[mapped['三级大类'].isin(scm_categories)]
+                kept_counts.append(len(mapped))
+                return mapped
+
+        benchmark_df, executed_sql = self.sql_processor.execute_sql_query(
+            sql_query, cgms=cgms, common_names=common_names,
+            strategy_categories=strategy_categories, lev3_org_name=lev3_org_name,
+            columns=self.mapping_processor.source_fields(map_df, source_type='table3'),
+            chunk_transform=chunk_transform
+        )
+        query_stats = benchmark_df.attrs.get('query_stats')
+        if chunk_transform is not None and query_stats and query_stats.get('streamed'):
+            query_stats['rows_kept'] = sum(kept_counts)
+        self._report_query_stats(benchmark_df)
+        if benchmark_df.empty and query_stats and query_stats.get('rows_scanned'):
+            self.reporter.warning("⚠️ 对标品数据中没有与新品三级大类相同的行，结果中只有新品行。")
+        elif benchmark_df.empty:
+            self.reporter.warning("⚠️ 对标品数据查询为空。")
+
+        if chunk_transform is None:
+            benchmark_df = self.mapping_processor.run_mapping(map_df, benchmark_df, source_type='table3')
+        else:
+            # 流式读取的结果已是分类类型，统一键列的类别顺序，其余列还原为对象列
+            benchmark_df = key_types.from_chunks(benchmark_df)
+        return key_types.categorize(benchmark_df), executed_sql
+
+    def _report_query_stats(self, benchmark_df: pd.DataFrame):
+        """
+        对标品查询命中缓存、复用了已取回的数据或流式读取时，通过 reporter.info 提示。
+        这类提示不是流程阶段，不经 status_updater 传递（阶段标签随即会被下一阶段覆盖）。
+        """
+        query_stats = benchmark_df.attrs.get('query_stats') or {}
+        if query_stats.get('cache_hit'):
+            message = f"⚡ 命中对标品查询缓存（数据日期: {query_stats.get('data_version')}），已跳过数据库查询。"
+        elif query_stats.get('incremental') and query_stats.get('fetched_rows', 0) < len(benchmark_df):
+            message = f"⚡ 复用已取回的对标品数据：共 {len(benchmark_df)} 行，本次仅从数据库补充 {query_stats.get('fetched_rows', 0)} 行。"
+        elif query_stats.get('indexed'):
+            message = f"⚡ 从共享取回的对标品数据中取出 {query_stats.get('rows_selected', 0)} 行，未单独查询数据库。"
+        elif query_stats.get('streamed'):
+            message = f"⚡ 流式读取对标品数据：扫描 {query_stats.get('rows_scanned', 0)} 行，按三级大类预筛选后保留 {query_stats.get('rows_kept', 0)} 行。"
+        else:
+            return
+        self.reporter.info(message)
+
 
 class DicaiStrategy(AnalysisStrategy):
     """地采模式的具体分析策略。"""
 
+    PURCHASE_MODE = '地采'
+
     def _enrich_scm_data(self, scm_df: pd.DataFrame) -> pd.DataFrame:
         """
         为地采模式丰富SCM数据，主要是关联战区信息。
@@ -53,13 +160,15 @@ class DicaiStrategy(AnalysisStrategy):
         current_df = scm_df.copy()
         try:
             if PURCHASE_CO_MAPPING_FILE.exists():
-                mapping_df = pd.read_excel(PURCHASE_CO_MAPPING_FILE)
+                # 映射文件未修改时复用上次读取的结果；后续会改写列类型，需复制
+                mapping_df = load_cached(PURCHASE_CO_MAPPING_FILE, pd.read_excel).copy()
                 
                 join_key = '采购公司'
                 target_col = '提报战区'
                 if join_key in current_df.columns and join_key in mapping_df.columns and target_col in mapping_df.columns:
-                    current_df[join_key] = current_df[join_key].astype(str)
-                    mapping_df[join_key] = mapping_df[join_key].astype(str)
+                    current_df[join_key], mapping_df[join_key] = key_types.join_keys(
+                        current_df[join_key], mapping_df[join_key]
+                    )
 
                     if target_col in current_df.columns:
                         current_df = current_df.drop(columns=[target_col])
@@ -70,105 +179,107 @@ class DicaiStrategy(AnalysisStrategy):
                         on=join_key,
                         how='left'
                     )
+                    current_df = key_types.categorize(current_df, [target_col])
                 else:
-                    st.warning("⚠️ 无法关联战区信息（缺少关联键或目标列）。")
+                    self.reporter.warning("⚠️ 无法关联战区信息（缺少关联键或目标列）。")
             else:
-                st.warning(f"⚠️ 未找到 '{PURCHASE_CO_MAPPING_FILE}' 文件，战区信息将不会关联。")
+                self.reporter.warning(f"⚠️ 未找到 '{PURCHASE_CO_MAPPING_FILE}' 文件，战区信息将不会关联。")
         except Exception as e:
-            st.error(f"❌ 关联战区信息时出错: {e}")
+            self.reporter.error(f"❌ 关联战区信息时出错: {e}")
         return current_df
 
-    def execute(self, map_df: pd.DataFrame, scm_df: pd.DataFrame) -> dict:
+    @staticmethod
+    def _filters_of(enriched_scm_df: pd.DataFrame) -> dict:
+        return {
+            "cgms": '地采',
+            "common_names": enriched_scm_df['通用名'].dropna().unique().tolist(),
+            "strategy_categories": enriched_scm_df['策略分类'].dropna().unique().tolist(),
+            "lev3_org_name": enriched_scm_df['提报战区'].dropna().unique().tolist(),
+        }
+
+    def benchmark_filters(self, scm_df: pd.DataFrame) -> dict:
+        return self._filters_of(self._enrich_scm_data(scm_df))
+
+    def prepare(self, map_df: pd.DataFrame, scm_df: pd.DataFrame) -> dict:
         self.status_updater(label="丰富地采数据...", state="running")
         enriched_scm_df = self._enrich_scm_data(scm_df)
         
         # 提取筛选条件
         self.status_updater(label="提取筛选条件...", state="running")
-        scm_common_names = enriched_scm_df['通用名'].dropna().unique().tolist()
-        scm_strategy_categories = enriched_scm_df['策略分类'].dropna().unique().tolist()
-        scm_lev3_org_name = enriched_scm_df['提报战区'].dropna().unique().tolist()
+        filters = self._filters_of(enriched_scm_df)
 
-        # 查询对标品数据
+        # 查询对标品数据并映射
+        map_scm_df = self.mapping_processor.run_mapping(map_df, enriched_scm_df, source_type='table2')
         self.status_updater(label="🔎 正在从数据库按[地采]规则查询对标品数据…", state="running")
-        sql_path = Path("对标品.sql")
-        sql_query = self.sql_processor.read_sql_file(sql_path)
-        benchmark_df, executed_sql = self.sql_processor.execute_sql_query(
-            sql_query, cgms='地采', common_names=scm_common_names, 
-            strategy_categories=scm_strategy_categories, lev3_org_name=scm_lev3_org_name
+        map_benchmark_df, executed_sql = self._fetch_benchmark(
+            map_df, map_scm_df, filters["cgms"], filters["common_names"], filters["strategy_categories"], filters["lev3_org_name"]
         )
-        if benchmark_df.empty: st.warning("⚠️ 对标品数据查询为空。")
 
-        # 映射与合并
+        # 合并
         self.status_updater(label="🧭 正在进行映射转换与数据分组…", state="running")
-        map_scm_df = self.mapping_processor.run_mapping(map_df, enriched_scm_df, source_type='table2')
-        map_benchmark_df = self.mapping_processor.run_mapping(map_df, benchmark_df, source_type='table3')
         # --- 核心修复：传入 'strategy' 参数 ---
-        target_df = self.data_merger.merge_and_sort_data(map_scm_df, map_benchmark_df, strategy='地采')
+        target_df = self.data_merger.merge_and_sort_data(map_scm_df, map_benchmark_df, strategy='地采', progress=self.progress)
         
         # 【地采特有】
         self.status_updater(label="📊 正在插入分隔行...", state="running")
         processed_df, sep_indices, scm_indices = self.data_processor.insert_group_separators(target_df)
         
-        # 格式化与导出
+        # 格式化
         self.status_updater(label="🎨 正在清理与格式化数据...", state="running")
         formatted_df = self.data_formatter.format_data(processed_df)
-        
-        self.status_updater(label="📦 正在按[地采]模板生成Excel文件…", state="running")
-        output, filename = self.result_exporter.export_to_excel(formatted_df, sep_indices, scm_indices, purchase_mode='地采')
-        
+
         return {
             "result_df": formatted_df,
-            "result_output": output,
-            "result_filename": filename,
+            "separator_indices": sep_indices,
+            "scm_indices": scm_indices,
             "executed_sql": executed_sql,
-            "new_product_count": len(scm_indices)
         }
 
 
 class TongcaiStrategy(AnalysisStrategy):
     """统采模式的具体分析策略。"""
 
-    def execute(self, map_df: pd.DataFrame, scm_df: pd.DataFrame) -> dict:
+    PURCHASE_MODE = '统采'
+
+    def benchmark_filters(self, scm_df: pd.DataFrame) -> dict:
+        return {
+            "cgms": '统采',
+            "common_names": scm_df['通用名'].dropna().unique().tolist(),
+            "strategy_categories": scm_df['策略分类'].dropna().unique().tolist(),
+            "lev3_org_name": None,
+        }
+
+    def prepare(self, map_df: pd.DataFrame, scm_df: pd.DataFrame) -> dict:
         # 提取筛选条件
         self.status_updater(label="提取筛选条件...", state="running")
-        scm_common_names = scm_df['通用名'].dropna().unique().tolist()
-        scm_strategy_categories = scm_df['策略分类'].dropna().unique().tolist()
+        filters = self.benchmark_filters(scm_df)
 
-        # 查询对标品数据
+        # 查询对标品数据并映射
+        map_scm_df = self.mapping_processor.run_mapping(map_df, scm_df, source_type='table2')
         self.status_updater(label="🔎 正在从数据库按[统采]规则查询对标品数据…", state="running")
-        sql_path = Path("对标品.sql")
-        sql_query = self.sql_processor.read_sql_file(sql_path)
-        benchmark_df, executed_sql = self.sql_processor.execute_sql_query(
-            sql_query, cgms='统采', common_names=scm_common_names, 
-            strategy_categories=scm_strategy_categories
+        map_benchmark_df, executed_sql = self._fetch_benchmark(
+            map_df, map_scm_df, filters["cgms"], filters["common_names"], filters["strategy_categories"]
         )
-        if benchmark_df.empty: st.warning("⚠️ 对标品数据查询为空。")
 
-        # 映射与合并
+        # 合并
         self.status_updater(label="🧭 正在进行映射转换与数据分组…", state="running")
-        map_scm_df = self.mapping_processor.run_mapping(map_df, scm_df, source_type='table2')
-        map_benchmark_df = self.mapping_processor.run_mapping(map_df, benchmark_df, source_type='table3')
         # --- 核心修复：传入 'strategy' 参数 ---
-        target_df = self.data_merger.merge_and_sort_data(map_scm_df, map_benchmark_df, strategy='统采')
+        target_df = self.data_merger.merge_and_sort_data(map_scm_df, map_benchmark_df, strategy='统采', progress=self.progress)
         
         # 【统采特有】不插入分隔行，直接获取 SCM 行索引
         self.status_updater(label="📊 正在识别新品行...", state="running")
         scm_indices = target_df[target_df['__source__'] == 'scm'].index.tolist()
         processed_df = target_df
         
-        # 格式化与导出
+        # 格式化
         self.status_updater(label="🎨 正在清理与格式化数据...", state="running")
         formatted_df = self.data_formatter.format_data(processed_df)
-        
-        self.status_updater(label="📦 正在按[统采]模板生成Excel文件…", state="running")
-        # 注意：为 separator_indices 传入空列表
-        output, filename = self.result_exporter.export_to_excel(formatted_df, [], scm_indices, purchase_mode='统采')
-        
+
+        # 注意：统采没有分隔行，separator_indices 为空列表
         return {
             "result_df": formatted_df,
-            "result_output": output,
-            "result_filename": filename,
+            "separator_indices": [],
+            "scm_indices": scm_indices,
             "executed_sql": executed_sql,
-            "new_product_count": len(scm_indices)
         }
 
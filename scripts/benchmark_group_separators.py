@@ -0,0 +1,70 @@
+"""
+对比 DataProcessor.insert_group_separators 新旧两种实现的耗时
+"""
+
+import time
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 将项目根目录添加到Python路径中，以便可以导入processing模块
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from processing.data_processor import DataProcessor
+
+# --- 配置 ---
+ROW_COUNTS = [1_000, 10_000, 100_000]
+COLUMN_COUNT = 150
+# 平均每个新品带出的对标品行数
+BENCHMARK_ROWS_PER_SCM = 20
+# 旧实现为平方复杂度，10万行需数十分钟，默认超过该行数时跳过（传入 --full 可强制执行）
+LEGACY_MAX_ROWS = 10_000
+
+
+def build_merged_df(n_rows: int) -> pd.DataFrame:
+    """构造与 DataMerger 输出结构相同的测试数据。"""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        rng.random((n_rows, COLUMN_COUNT)),
+        columns=[f"字段{i}" for i in range(COLUMN_COUNT)]
+    )
+    is_scm = rng.random(n_rows) < 1 / (BENCHMARK_ROWS_PER_SCM + 1)
+    is_scm[0] = True
+    df['__source__'] = np.where(is_scm, 'scm', 'benchmark')
+    return df
+
+
+def time_engine(df: pd.DataFrame, engine: str):
+    start = time.perf_counter()
+    result = DataProcessor.insert_group_separators(df, engine=engine)
+    return time.perf_counter() - start, result
+
+
+def main():
+    run_full = "--full" in sys.argv
+    print(f"{'行数':>10} {'新品数':>8} {'vectorized(秒)':>16} {'legacy(秒)':>12} {'加速比':>8}")
+    for n_rows in ROW_COUNTS:
+        df = build_merged_df(n_rows)
+        scm_count = int((df['__source__'] == 'scm').sum())
+
+        vectorized_time, vectorized_result = time_engine(df, 'vectorized')
+        if n_rows > LEGACY_MAX_ROWS and not run_full:
+            print(f"{n_rows:>10} {scm_count:>8} {vectorized_time:>16.3f} {'跳过':>12} {'-':>8}")
+            continue
+
+        legacy_time, legacy_result = time_engine(df, 'legacy')
+
+        # 校验两种实现的输出一致
+        pd.testing.assert_frame_equal(vectorized_result[0], legacy_result[0])
+        assert vectorized_result[1] == legacy_result[1]
+        assert vectorized_result[2] == legacy_result[2]
+
+        print(f"{n_rows:>10} {scm_count:>8} {vectorized_time:>16.3f} {legacy_time:>12.3f} {legacy_time / vectorized_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    # 在项目根目录下运行: python scripts/benchmark_group_separators.py [--full]
+    main()
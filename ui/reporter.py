@@ -0,0 +1,18 @@
+import streamlit as st
+from utils.reporter import Reporter
+
+
+class StreamlitReporter(Reporter):
+    """在页面上显示提示信息。处理器实例在会话间共享，因此不记录信息。"""
+
+    def _record(self, level: str, message: str):
+        pass
+
+    def info(self, message: str):
+        st.info(message)
+
+    def warning(self, message: str):
+        st.warning(message)
+
+    def error(self, message: str):
+        st.error(message)
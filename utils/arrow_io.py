@@ -0,0 +1,37 @@
+"""
+DataFrame 与 Arrow(Feather) 文件之间的转换。
+文件不压缩。read_table 以内存映射方式打开，返回的 Arrow 表在多个进程间共享同一份页缓存，
+只在取出所需的行时才转换为 DataFrame；read_dataframe 则把整份文件复制为普通的 DataFrame。
+"""
+
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+
+def to_arrow(df: pd.DataFrame) -> pa.Table:
+    """转换为 Arrow 表；混有多种类型的文本列（如数字与字符串混排）按字符串保存，空值保持为空。"""
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        converted = df.copy()
+        for col in converted.columns[converted.dtypes == object]:
+            series = converted[col]
+            converted[col] = series.where(series.isna(), series.astype(str))
+        return pa.Table.from_pandas(converted, preserve_index=False)
+
+
+def write_feather(df: pd.DataFrame, path: Path):
+    """不压缩写入，读取时可直接内存映射。"""
+    feather.write_feather(to_arrow(df), path, compression="uncompressed")
+
+
+def read_table(path: Path) -> pa.Table:
+    """以内存映射方式打开 Feather 文件。"""
+    return feather.read_table(path, memory_map=True)
+
+
+def read_dataframe(path: Path) -> pd.DataFrame:
+    """把 Feather 文件整份读入为普通的 DataFrame（列为 numpy/object 类型）。"""
+    return feather.read_feather(path, memory_map=False)
@@ -0,0 +1,69 @@
+"""
+导出Excel时使用的样式定义与命名样式注册表。
+同一工作簿内，每种 (数字格式, 字体, 填充, 是否表头, 对齐) 组合只注册一次命名样式，
+单元格只按名称引用样式，避免逐格创建 Font/Alignment/Border 等对象，写入更快。
+openpyxl 保存时本来就会合并相同的单元格格式，因此文件体积基本不变。
+"""
+
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT as WORKBOOK_DEFAULT_FONT
+
+# --- 定义样式 ---
+DEFAULT_FONT = Font(name='微软雅黑', size=9)
+HEADER_FONT = Font(name='微软雅黑', size=9, bold=True)
+RED_FONT = Font(name='微软雅黑', size=9, color="FF0000")
+
+WRAP_ALIGNMENT = Alignment(horizontal='left', vertical='center', wrap_text=True)
+NO_WRAP_ALIGNMENT = Alignment(horizontal='left', vertical='center', wrap_text=False)
+
+YELLOW_FILL = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
+
+THIN_BORDER_SIDE = Side(style='thin', color='000000')
+THIN_BORDER = Border(left=THIN_BORDER_SIDE, right=THIN_BORDER_SIDE, top=THIN_BORDER_SIDE, bottom=THIN_BORDER_SIDE)
+
+FONTS = {'default': DEFAULT_FONT, 'red': RED_FONT}
+ALIGNMENTS = {'wrap': WRAP_ALIGNMENT, 'no_wrap': NO_WRAP_ALIGNMENT}
+
+
+class StyleRegistry:
+    """单个工作簿内的命名样式注册表，所有样式都带细边框。"""
+
+    def __init__(self, workbook, prefix: str = '目标表样式'):
+        """
+        Args:
+            workbook: openpyxl 工作簿（普通模式或只写模式均可）。
+            prefix (str): 命名样式名称前缀。
+        """
+        self.workbook = workbook
+        self.prefix = prefix
+        self._names = {}
+
+    @property
+    def created_count(self) -> int:
+        """本工作簿中已创建的不同命名样式数量。"""
+        return len(self._names)
+
+    def name(self, number_format: str = None, font: str = None, filled: bool = False, is_header: bool = False, alignment: str = None) -> str:
+        """
+        返回指定样式组合对应的命名样式名称，首次使用时注册到工作簿。
+
+        Args:
+            number_format: 数字格式，None 表示常规格式。
+            font: 'default' / 'red'，None 表示工作簿默认字体。
+            filled: 是否使用SCM行的黄色背景。
+            is_header: 是否为表头（加粗字体）。
+            alignment: 'wrap' / 'no_wrap'，None 表示不设置对齐。
+        """
+        key = (number_format, font, filled, is_header, alignment)
+        if key not in self._names:
+            style = NamedStyle(name=f'{self.prefix}{len(self._names) + 1}', border=THIN_BORDER)
+            style.font = HEADER_FONT if is_header else FONTS.get(font, WORKBOOK_DEFAULT_FONT)
+            if alignment is not None:
+                style.alignment = ALIGNMENTS[alignment]
+            if number_format is not None:
+                style.number_format = number_format
+            if filled:
+                style.fill = YELLOW_FILL
+            self.workbook.add_named_style(style)
+            self._names[key] = style.name
+        return self._names[key]
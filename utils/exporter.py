@@ -1,136 +1,294 @@
 import pandas as pd
+import datetime as dt
+import time
 from io import BytesIO
 from datetime import datetime
-from typing import Tuple, List
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.cell import MergedCell
+from typing import Callable, List, Optional, Tuple
+from openpyxl import Workbook
+from openpyxl.cell import MergedCell, WriteOnlyCell
 from openpyxl.utils import get_column_letter
+from pandas.api.types import is_bool, is_float, is_integer, is_scalar
+from config import EXPORT_ENGINE, PROGRESS_INTERVAL_ROWS
+from processing.column_schema import compile_columns
+from utils.excel_styles import StyleRegistry
+from utils.jobs import JobProgress
+
+# --- 地采分隔行布局：合并Y-AL列和AV-BF列，公式写在合并区域的首列 ---
+SEPARATOR_MERGE_RANGES = [(25, 38), (48, 58)]
+SEPARATOR_ROW_HEIGHT = 150
+
+# 单一采购模式导出时的工作表名
+SHEET_NAME = '目标表'
+
+# pandas 写入日期时默认使用的数字格式
+DATETIME_FORMAT = 'YYYY-MM-DD HH:MM:SS'
+DATE_FORMAT = 'YYYY-MM-DD'
+
+
+def _separator_formulas(scm_data_row: int) -> dict:
+    """返回地采分隔行中 {列号: 公式}，公式引用紧随其后的SCM数据行。"""
+    # 地采模式的新公式
+    formula1 = f'=I{scm_data_row}&CHAR(10)&"1.顾客：；"&CHAR(10)&"2.公司：；"&CHAR(10)&"3.市场分析：；"&CHAR(10)&"4.供应商条件："&DB{scm_data_row}&"，"&DE{scm_data_row}&"，"&DI{scm_data_row}&"；"&CHAR(10)&"5.医保："&CK{scm_data_row}&"，"&"支付价"&"："&CL{scm_data_row}&"；"&CHAR(10)&"6.铺货通道："&CV{scm_data_row}&"；"&CHAR(10)&"挑战点：1.；"&CHAR(10)&"修改点：1.；"'
+    formula2 = f'="【引进理由】"&L{scm_data_row}&CHAR(10)&"【成份】"&EX{scm_data_row}&CHAR(10)&"【适应症】"&EZ{scm_data_row}&CHAR(10)&"【卖点】"&FB{scm_data_row}&CHAR(10)&"【关键搜索词】"&FC{scm_data_row}'
+    return {
+        25: formula1,
+        48: formula2,
+        # 在分隔行的A/C/O列添加公式
+        1: f'="压测"&M{scm_data_row}',
+        3: f'=C{scm_data_row}',
+        15: f'=O{scm_data_row}',
+    }
+
+
+def _excel_value(value):
+    """
+    按 pandas.to_excel 的规则把单元格值转换为写入值，返回 (值, 默认数字格式)。
+    """
+    if is_scalar(value) and pd.isna(value):
+        return '', None
+    if is_integer(value):
+        return int(value), None
+    if is_float(value):
+        if value == float('inf'):
+            return 'inf', None
+        if value == float('-inf'):
+            return '-inf', None
+        return float(value), None
+    if is_bool(value):
+        return bool(value), None
+    if isinstance(value, dt.datetime):
+        return value, DATETIME_FORMAT
+    if isinstance(value, dt.date):
+        return value, DATE_FORMAT
+    if isinstance(value, dt.timedelta):
+        return value.total_seconds() / 86400, '0'
+    return str(value), None
+
 
 class ResultExporter:
     """结果导出类，负责生成和下载结果文件，并应用复杂的格式。"""
 
     @staticmethod
-    def export_to_excel(df: pd.DataFrame, separator_indices: List[int], scm_indices: List[int], purchase_mode: str) -> Tuple[BytesIO, str]:
+    def progress_name(sheet_name: str) -> str:
+        """导出进度在 JobProgress 中的计数名称（按已写出的数据行数计）。"""
+        return f"导出[{sheet_name}]行"
+
+    @staticmethod
+    def export_to_excel(df: pd.DataFrame, separator_indices: List[int], scm_indices: List[int], purchase_mode: str, engine: str = EXPORT_ENGINE, progress: JobProgress = None) -> Tuple[BytesIO, str, dict]:
         """
         导出DataFrame到Excel，并应用所有指定的格式。
         该函数现在能正确处理 separator_indices 为空列表的情况（统采模式）。
+
+        Args:
+            engine (str): 'streaming' 以只写模式逐行写入并一次性套用样式；'openpyxl' 为旧实现。
+            progress (JobProgress): 后台任务的进度，按已写出的行数更新；任务取消时在写入循环中抛出 JobCancelled。
+
+        Returns:
+            Tuple[BytesIO, str, dict]: 文件内容、文件名，以及导出统计（引擎、命名样式数、耗时秒数）。
+        """
+        output_mode = '地采' if purchase_mode != '统采' else '统采'
+        return ResultExporter._export([(SHEET_NAME, df, separator_indices, scm_indices)], output_mode, engine, progress)
+
+    @staticmethod
+    def export_sheets(sheets: List[Tuple[str, pd.DataFrame, List[int], List[int]]], purchase_modes: List[str], engine: str = EXPORT_ENGINE, progress: JobProgress = None) -> Tuple[BytesIO, str, dict]:
+        """
+        把多个结果表写入同一个工作簿（如混合采购模式的上传，每种采购模式一个工作表）。
+
+        Args:
+            sheets: [(工作表名, df, separator_indices, scm_indices)]，格式规则与 export_to_excel 相同。
+            purchase_modes (List[str]): 工作簿包含的采购模式，用于生成文件名。
         """
+        return ResultExporter._export(sheets, ''.join(purchase_modes), engine, progress)
+
+    @staticmethod
+    def _export(sheets: list, output_mode: str, engine: str, progress: Optional[JobProgress]) -> Tuple[BytesIO, str, dict]:
+        if engine not in ('streaming', 'openpyxl'):
+            raise ValueError("engine 必须是 'streaming' 或 'openpyxl'")
+
+        start = time.perf_counter()
         output = BytesIO()
-        
+        progress = progress or JobProgress()
+        if engine == 'streaming':
+            style_count = ResultExporter._write_streaming(sheets, output, progress)
+        else:
+            style_count = ResultExporter._write_openpyxl(sheets, output, progress)
+
+        output.seek(0)
+        filename = f'{output_mode}新品过会分析表_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        export_stats = {
+            "engine": engine,
+            "named_styles": style_count,
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+        return output, filename, export_stats
+
+    @staticmethod
+    def _write_streaming(sheets: list, output: BytesIO, progress: JobProgress) -> int:
+        """
+        只写模式导出：每个单元格只生成一次，值、样式、填充、合并和公式在同一次遍历中完成。
+        返回本次创建的命名样式数量（各工作表共用同一个样式注册表）。
+        """
+        workbook = Workbook(write_only=True)
+        registry = StyleRegistry(workbook)
+        for sheet_name, df, separator_indices, scm_indices in sheets:
+            ResultExporter._write_streaming_sheet(
+                workbook.create_sheet(sheet_name), registry, df, separator_indices, scm_indices,
+                lambda done: progress.report(ResultExporter.progress_name(sheet_name), done, len(df))
+            )
+        workbook.save(output)
+        return registry.created_count
+
+    @staticmethod
+    def _write_streaming_sheet(worksheet, registry: StyleRegistry, df: pd.DataFrame, separator_indices: List[int], scm_indices: List[int], report_rows: Callable[[int], None]):
+        columns = list(df.columns)
+        separator_rows = set(separator_indices)
+        scm_rows = set(scm_indices)
+        # 与旧实现一致：仅当首列含占位符时才清除 "_SEPARATOR_"
+        replace_placeholder = "_SEPARATOR_" in df.iloc[:, 0].values
+
+        # 旧实现中合并区域超出数据列宽时，超出部分同样会被加边框并补 '-'
+        width = len(columns)
+        if separator_indices:
+            width = max(width, SEPARATOR_MERGE_RANGES[-1][1])
+        merged_interior = {
+            col for start, end in SEPARATOR_MERGE_RANGES for col in range(start + 1, end + 1)
+        }
+        wrap_anchors = {start for start, _ in SEPARATOR_MERGE_RANGES}
+
+        def make_cell(value, style_name):
+            cell = WriteOnlyCell(worksheet, value=value)
+            cell.style = style_name
+            return cell
+
+        rules = compile_columns(columns)
+
+        # --- 分隔行：行高与合并区域需在写入行之前登记 ---
+        for sep_idx in separator_indices:
+            excel_row = sep_idx + 2
+            worksheet.row_dimensions[excel_row].height = SEPARATOR_ROW_HEIGHT
+            for start, end in SEPARATOR_MERGE_RANGES:
+                worksheet.merged_cells.add(
+                    f'{get_column_letter(start)}{excel_row}:{get_column_letter(end)}{excel_row}'
+                )
+
+        # --- 表头 ---
+        header = [
+            make_cell(_excel_value(col)[0], registry.name(is_header=True, alignment='wrap'))
+            for col in columns
+        ]
+        header += [make_cell(None, registry.name()) for _ in range(len(columns), width)]
+        worksheet.append(header)
+
+        # --- 数据行 ---
+        for row_pos, values in enumerate(df.itertuples(index=False, name=None)):
+            if row_pos % PROGRESS_INTERVAL_ROWS == 0:
+                report_rows(row_pos)
+            is_separator = row_pos in separator_rows
+            filled = row_pos in scm_rows
+            formulas = _separator_formulas(row_pos + 3) if is_separator else {}
+            row = []
+            for col_idx in range(1, width + 1):
+                if is_separator and col_idx in merged_interior:
+                    row.append(make_cell(None, registry.name()))
+                    continue
+                if col_idx > len(columns):
+                    if col_idx in formulas:
+                        alignment = 'wrap' if col_idx in wrap_anchors else None
+                        row.append(make_cell(formulas[col_idx], registry.name(alignment=alignment)))
+                    else:
+                        row.append(make_cell('-', registry.name()))
+                    continue
+
+                value = values[col_idx - 1]
+                if replace_placeholder and value == "_SEPARATOR_":
+                    value = ''
+                value, value_format = _excel_value(value)
+                if col_idx in formulas:
+                    value = formulas[col_idx]
+
+                style_name = registry.name(
+                    number_format=rules[col_idx - 1].number_format or value_format,
+                    font=rules[col_idx - 1].font,
+                    filled=filled,
+                    alignment='wrap' if is_separator and col_idx in wrap_anchors else 'no_wrap',
+                )
+                row.append(make_cell(value, style_name))
+            worksheet.append(row)
+        report_rows(len(df))
+
+    @staticmethod
+    def _write_openpyxl(sheets: list, output: BytesIO, progress: JobProgress) -> int:
+        """
+        先由 pandas 整表写入，再在一次遍历中为每个单元格指定一个命名样式。
+        返回本次创建的命名样式数量（各工作表共用同一个样式注册表）。
+        """
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            registry = StyleRegistry(writer.book)
+            for sheet_name, df, separator_indices, scm_indices in sheets:
+                ResultExporter._write_openpyxl_sheet(
+                    writer, sheet_name, registry, df, separator_indices, scm_indices,
+                    lambda done: progress.report(ResultExporter.progress_name(sheet_name), done, len(df))
+                )
+        return registry.created_count
+
+    @staticmethod
+    def _write_openpyxl_sheet(writer: pd.ExcelWriter, sheet_name: str, registry: StyleRegistry, df: pd.DataFrame, separator_indices: List[int], scm_indices: List[int], report_rows: Callable[[int], None]):
         # 统采模式下，不需要分隔符占位符，可以直接写入
         df_to_write = df.copy()
         if "_SEPARATOR_" in df_to_write.iloc[:, 0].values:
              df_to_write = df.replace("_SEPARATOR_", "")
 
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_to_write.to_excel(writer, index=False, sheet_name='目标表')
-            
-            workbook = writer.book
-            worksheet = writer.sheets['目标表']
-
-            # --- 定义样式 ---
-            default_font = Font(name='微软雅黑', size=9)
-            header_font = Font(name='微软雅黑', size=9, bold=True)
-            red_font = Font(name='微软雅黑', size=9, color="FF0000")
-            
-            wrap_alignment = Alignment(horizontal='left', vertical='center', wrap_text=True) 
-            no_wrap_alignment = Alignment(horizontal='left', vertical='center', wrap_text=False)
-
-            yellow_fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
-            
-            thin_border_side = Side(style='thin', color='000000')
-            thin_border = Border(left=thin_border_side, right=thin_border_side, top=thin_border_side, bottom=thin_border_side)
-
-            # --- 定义数字格式 ---
-            percent_format = '0.00%;-0.00%;0.00%;@'
-            decimal_2_format = '0.00;-0.00;0.00;@'
-            decimal_1_format = '0.0;-0.0;0.0;@'
-            integer_format = '0;-0;0;@'
-            text_format = '@'
-            
-            column_formats = {
-                '返利率(%)': percent_format, '通用名补偿后毛利率': percent_format,
-                '日服/使用成交价（顾客）': decimal_2_format, '日服/使用底价': decimal_2_format,
-                '标准单位进价': decimal_2_format, '标准单位底价': decimal_2_format,
-                '标准单位成交价': decimal_2_format, '标准单位综合毛利额': decimal_2_format,
-                '标准单位零售定价': decimal_2_format, '进价': decimal_2_format,
-                '新品底价/对标品最低底价': decimal_2_format, '底价 *(返利后)': decimal_2_format,
-                '近90天门店最新一批的底价': decimal_2_format,'近90天门店级最低底价': decimal_2_format, 
-                '9000的移动平均价':decimal_2_format, '9000的最后进价':decimal_2_format,
-                '【使用最新】近90天购进批次的最新底价-不含销售返利':decimal_2_format,
-                '【使用最低】近90天购进批次的最低底价':decimal_2_format,
-                '预估/实际成交价': decimal_1_format, '建议零售价': decimal_1_format,
-                '过会编码': text_format, '新品编码': text_format, '国际条码': text_format,
-                '近90天月均销售数量': integer_format, '近90天月均销售金额': integer_format,
-                '近90天月均前台含税毛利额': integer_format, '近90天月均补偿后含税毛利额': integer_format,
-                '超级旗舰店铺货商品数量': integer_format, '旗舰店铺货商品数量': integer_format,
-                '大店铺货商品数量': integer_format, '中店铺货商品数量': integer_format,
-                '小店铺货商品数量': integer_format, '成长店铺货商品数量': integer_format,
-                '通用名月均销量': integer_format, '通用名月均销售额': integer_format,
-                '通用名月均前台毛利额': integer_format, '通用名月均补偿后毛利额': integer_format,
-            }
-            red_font_columns = ['新品底价/对标品最低底价', '底价 *(返利后)']
-
-            # --- 应用常规样式和格式 ---
-            for col_idx, col_name in enumerate(df_to_write.columns, 1):
-                header_cell = worksheet.cell(row=1, column=col_idx)
-                header_cell.font = header_font
-                header_cell.alignment = wrap_alignment
-                
-                for row_idx in range(2, len(df_to_write) + 2):
-                    cell = worksheet.cell(row=row_idx, column=col_idx)
-                    cell.alignment = no_wrap_alignment
-                    cell.font = red_font if col_name in red_font_columns else default_font
-                    if col_name in column_formats:
-                        cell.number_format = column_formats[col_name]
-
-            # --- 处理分隔行：背景色、合并、公式 (仅在地采模式下执行) ---
-            if separator_indices:
-                for sep_idx in separator_indices:
-                    excel_row = sep_idx + 2
-                    worksheet.row_dimensions[excel_row].height = 150
-                    
-                    # 地采逻辑：合并Y-AL列和AV-BF列
-                    worksheet.merge_cells(start_row=excel_row, start_column=25, end_row=excel_row, end_column=38) # Y to AL
-                    worksheet.merge_cells(start_row=excel_row, start_column=48, end_row=excel_row, end_column=58) # AV to BF
-                    
-                    worksheet.cell(row=excel_row, column=25).alignment = wrap_alignment
-                    worksheet.cell(row=excel_row, column=48).alignment = wrap_alignment
-                    
-                    scm_data_row = excel_row + 1
-                    
-                    # 地采模式的新公式
-                    formula1 = f'=I{scm_data_row}&CHAR(10)&"1.顾客：；"&CHAR(10)&"2.公司：；"&CHAR(10)&"3.市场分析：；"&CHAR(10)&"4.供应商条件："&DB{scm_data_row}&"，"&DE{scm_data_row}&"，"&DI{scm_data_row}&"；"&CHAR(10)&"5.医保："&CK{scm_data_row}&"，"&"支付价"&"："&CL{scm_data_row}&"；"&CHAR(10)&"6.铺货通道："&CV{scm_data_row}&"；"&CHAR(10)&"挑战点：1.；"&CHAR(10)&"修改点：1.；"'
-                    formula2 = f'="【引进理由】"&L{scm_data_row}&CHAR(10)&"【成份】"&EX{scm_data_row}&CHAR(10)&"【适应症】"&EZ{scm_data_row}&CHAR(10)&"【卖点】"&FB{scm_data_row}&CHAR(10)&"【关键搜索词】"&FC{scm_data_row}'
-                    
-                    worksheet.cell(row=excel_row, column=25).value = formula1
-                    worksheet.cell(row=excel_row, column=48).value = formula2
-                    
-                    # 在分隔行的A/C/O列添加公式
-                    worksheet.cell(row=excel_row, column=1).value = f'="压测"&M{scm_data_row}'
-                    worksheet.cell(row=excel_row, column=3).value = f'=C{scm_data_row}'
-                    worksheet.cell(row=excel_row, column=15).value = f'=O{scm_data_row}'
-
-            # --- 处理SCM行：背景色 (所有模式都需要) ---
-            for scm_idx in scm_indices:
-                excel_row = scm_idx + 2
-                for i in range(1, len(df_to_write.columns) + 1):
-                    worksheet.cell(row=excel_row, column=i).fill = yellow_fill
-                
-            # --- 后处理步骤 ---
-            for row in worksheet.iter_rows(min_row=2, max_row=worksheet.max_row, min_col=1, max_col=worksheet.max_column):
-                for cell in row:
-                    if isinstance(cell, MergedCell):
-                        continue
-                    if cell.value is None:
-                        cell.value = '-'
-
-            for row in worksheet.iter_rows(min_row=1, max_row=worksheet.max_row, min_col=1, max_col=worksheet.max_column):
-                for cell in row:
-                    cell.border = thin_border
+        df_to_write.to_excel(writer, index=False, sheet_name=sheet_name)
+        worksheet = writer.sheets[sheet_name]
 
-        output.seek(0)
-        output_mode = '地采' if purchase_mode != '统采' else '统采'
+        # --- 处理分隔行：行高、合并、公式 (仅在地采模式下执行) ---
+        wrap_cells = set()
+        for sep_idx in separator_indices:
+            excel_row = sep_idx + 2
+            worksheet.row_dimensions[excel_row].height = SEPARATOR_ROW_HEIGHT
 
-        filename = f'{output_mode}新品过会分析表_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        return output, filename
+            # 地采逻辑：合并Y-AL列和AV-BF列
+            for start, end in SEPARATOR_MERGE_RANGES:
+                worksheet.merge_cells(start_row=excel_row, start_column=start, end_row=excel_row, end_column=end)
+                wrap_cells.add((excel_row, start))
+
+            for col_idx, formula in _separator_formulas(excel_row + 1).items():
+                worksheet.cell(row=excel_row, column=col_idx).value = formula
+
+        # --- 逐格指定命名样式；SCM行加黄色背景，数据区外的空单元格补 '-' ---
+        n_cols = len(df_to_write.columns)
+        rules = compile_columns(df_to_write.columns)
+        scm_rows = {scm_idx + 2 for scm_idx in scm_indices}
+
+        for row_pos, row in enumerate(worksheet.iter_rows(min_row=1, max_row=worksheet.max_row, min_col=1, max_col=worksheet.max_column)):
+            # 表头行不计入已导出的行数
+            if row_pos and (row_pos - 1) % PROGRESS_INTERVAL_ROWS == 0:
+                report_rows(row_pos - 1)
+            for cell in row:
+                if isinstance(cell, MergedCell):
+                    cell.style = registry.name()
+                    continue
+
+                alignment = 'wrap' if (cell.row, cell.column) in wrap_cells else None
+                if cell.row == 1:
+                    if cell.column <= n_cols:
+                        cell.style = registry.name(is_header=True, alignment='wrap')
+                    else:
+                        cell.style = registry.name()
+                    continue
+
+                if cell.value is None:
+                    cell.value = '-'
+                if cell.column > n_cols:
+                    cell.style = registry.name(alignment=alignment)
+                    continue
+
+                # pandas 为日期值设置的数字格式在没有列格式时保留
+                value_format = cell.number_format if cell.number_format != 'General' else None
+                cell.style = registry.name(
+                    number_format=rules[cell.column - 1].number_format or value_format,
+                    font=rules[cell.column - 1].font,
+                    filled=cell.row in scm_rows,
+                    alignment=alignment or 'no_wrap',
+                )
+        report_rows(len(df))
@@ -1,52 +1,94 @@
 import pandas as pd
 import io
-import tempfile
-import os
-from config import setup_logging
+import time
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import Iterable, List, Optional
+from config import setup_logging, EXCEL_READ_ENGINE
 
 logger = setup_logging()
 
+# Excel 文件头：xlsx 为 zip 包，xls 为 OLE2 复合文档
+XLSX_MAGIC = b'PK\x03\x04'
+XLS_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+
+@lru_cache(maxsize=1)
+def _calamine_available() -> bool:
+    return find_spec("python_calamine") is not None
+
+
 class FileProcessor:
     """文件处理类，负责Excel文件的读取"""
 
     @staticmethod
-    def read_excel_safe(file_path_or_buffer, dtype_spec=None) -> pd.DataFrame:
+    def sniff_format(data: bytes) -> str:
+        """根据文件头判断Excel格式，返回 'xlsx'、'xls' 或 'unknown'。"""
+        if data.startswith(XLSX_MAGIC):
+            return 'xlsx'
+        if data.startswith(XLS_MAGIC):
+            return 'xls'
+        return 'unknown'
+
+    @staticmethod
+    def _candidate_engines(file_format: str) -> List[str]:
+        """按文件格式和 EXCEL_READ_ENGINE 配置返回依次尝试的读取引擎。"""
+        if EXCEL_READ_ENGINE not in ('auto', 'calamine', 'default'):
+            raise ValueError("EXCEL_READ_ENGINE 必须是 'auto'、'calamine' 或 'default'")
+
+        engines = []
+        if EXCEL_READ_ENGINE != 'default':
+            if _calamine_available():
+                engines.append('calamine')
+            elif EXCEL_READ_ENGINE == 'calamine':
+                logger.warning("未安装 python-calamine，改用默认引擎读取Excel。")
+
+        if file_format == 'xlsx':
+            engines.append('openpyxl')
+        elif file_format == 'xls':
+            engines.append('xlrd')
+        else:
+            engines.extend(['openpyxl', 'xlrd'])
+        return engines
+
+    @staticmethod
+    def read_excel_safe(file_path_or_buffer, dtype_spec=None, usecols: Optional[Iterable[str]] = None) -> pd.DataFrame:
         """
         安全的Excel读取方法。
         新增功能：可以接收一个dtype参数来为特定列指定数据类型。
+        传入 usecols 时只保留列名在其中的列（文件中不存在的列名会被忽略），
+        其余列不做类型转换、不进入结果。
+        文件内容只读入内存一次，按文件头选择引擎直接从内存解析，不再写临时文件；
+        解析耗时与所用引擎记录在返回结果的 attrs['parse_stats'] 中。
         """
-        # 将传入的文件或缓冲区统一转换为BytesIO对象
+        # 将传入的文件或缓冲区统一读取为字节串
         if hasattr(file_path_or_buffer, 'getvalue'):
-            buffer = io.BytesIO(file_path_or_buffer.getvalue())
+            data = file_path_or_buffer.getvalue()
             file_name = getattr(file_path_or_buffer, 'name', 'in-memory-file')
         else:
             with open(file_path_or_buffer, 'rb') as f:
-                buffer = io.BytesIO(f.read())
+                data = f.read()
             file_name = str(file_path_or_buffer)
 
-        # 创建一个带.xlsx后缀的临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
-            temp_file_path = temp_file.name
-            buffer.seek(0)
-            temp_file.write(buffer.read())
-
-        try:
-            # 尝试使用不同的引擎读取
-            engines = ['openpyxl', 'xlrd']
-            for engine in engines:
-                try:
-                    # 在读取时传入dtype参数
-                    return pd.read_excel(temp_file_path, engine=engine, dtype=dtype_spec)
-                except Exception as e:
-                    logger.warning(f"使用引擎 '{engine}' 读取 '{file_name}' 失败: {e}")
-                    continue
-            
-            # 如果所有引擎都失败了
-            raise ValueError(f"无法使用任何可用引擎读取文件 '{file_name}'。请确认文件格式正确且未损坏。")
-            
-        finally:
-            # 确保临时文件被删除
+        file_format = FileProcessor.sniff_format(data)
+        if usecols is not None:
+            allowed = set(usecols)
+            usecols = lambda column: column in allowed
+            if dtype_spec:
+                dtype_spec = {column: dtype for column, dtype in dtype_spec.items() if column in allowed}
+        for engine in FileProcessor._candidate_engines(file_format):
+            start = time.perf_counter()
             try:
-                os.unlink(temp_file_path)
-            except Exception as cleanup_e:
-                logger.warning(f"清理临时文件 '{temp_file_path}' 失败: {cleanup_e}")
+                # 在读取时传入dtype参数
+                df = pd.read_excel(io.BytesIO(data), engine=engine, dtype=dtype_spec, usecols=usecols)
+            except Exception as e:
+                logger.warning(f"使用引擎 '{engine}' 读取 '{file_name}' 失败: {e}")
+                continue
+
+            seconds = round(time.perf_counter() - start, 3)
+            logger.info(f"已读取 '{file_name}' (格式: {file_format}, 引擎: {engine}, 耗时: {seconds} 秒)")
+            df.attrs['parse_stats'] = {"file": file_name, "format": file_format, "engine": engine, "seconds": seconds}
+            return df
+
+        # 如果所有引擎都失败了
+        raise ValueError(f"无法使用任何可用引擎读取文件 '{file_name}'。请确认文件格式正确且未损坏。")
@@ -0,0 +1,165 @@
+"""
+后台任务：分析流程在线程池中运行，页面只负责提交、轮询进度与取消，不阻塞会话。
+取消是协作式的：JobProgress.cancel() 只设置标志，处理器在阶段切换以及合并、导出的长循环中
+调用 update_status()/report() 时抛出 JobCancelled；正在执行的单条数据库查询不会被打断。
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from config import setup_logging, JOB_WORKERS, JOB_HISTORY_MAX
+from utils.reporter import Reporter
+
+logger = setup_logging()
+
+
+class JobCancelled(InterruptedError):
+    """任务已被取消。"""
+
+
+class JobProgress:
+    """任务的当前阶段、各项计数与取消标志；可在多个线程中同时更新。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self.stage = "等待运行…"
+        # {计数名称: (已完成, 总数)}
+        self._counters: Dict[str, tuple] = {}
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check(self):
+        """任务已取消时抛出 JobCancelled。"""
+        if self._cancelled.is_set():
+            raise JobCancelled("任务已取消。")
+
+    def update_status(self, label: str, state: str = "running"):
+        """用作策略的 status_updater：记录当前阶段，并在阶段切换时检查是否已取消。"""
+        self.check()
+        with self._lock:
+            self.stage = label
+
+    def report(self, name: str, done: int, total: int):
+        """更新一项计数（如已合并、已导出的行数），并检查是否已取消。"""
+        with self._lock:
+            self._counters[name] = (done, total)
+        self.check()
+
+    def snapshot(self) -> dict:
+        """{"stage": 当前阶段, "counters": {计数名称: (已完成, 总数)}}"""
+        with self._lock:
+            return {"stage": self.stage, "counters": dict(self._counters)}
+
+
+class Job:
+    """一个已提交的后台任务。"""
+
+    def __init__(self, job_id: str, label: str):
+        self.id = job_id
+        self.label = label
+        self.progress = JobProgress()
+        # 任务运行期间的提示信息，由页面在轮询时显示
+        self.reporter = Reporter()
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.future: Optional[Future] = None
+
+    @property
+    def state(self) -> str:
+        """'pending' / 'running' / 'done' / 'failed' / 'cancelled'。"""
+        if not self.future.done():
+            return 'running' if self.future.running() else 'pending'
+        if self.future.cancelled() or isinstance(self.future.exception(), JobCancelled):
+            return 'cancelled'
+        return 'failed' if self.future.exception() is not None else 'done'
+
+    @property
+    def finished(self) -> bool:
+        return self.future.done()
+
+    @property
+    def result(self):
+        """任务函数的返回值；任务未成功结束时为 None。"""
+        return self.future.result() if self.state == 'done' else None
+
+    @property
+    def error(self) -> Optional[BaseException]:
+        return self.future.exception() if self.state == 'failed' else None
+
+
+class JobRunner:
+    """后台任务的线程池与任务登记表，在各会话间共享。"""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, history: int = JOB_HISTORY_MAX):
+        """
+        Args:
+            max_workers (int): 同时运行的任务数，超出的任务排队等待。
+            history (int): 最多保留的已结束任务数。
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.history = history
+
+    def submit(self, label: str, fn: Callable[[Job], object]) -> Job:
+        """提交任务，fn 在后台线程中以 Job 为参数调用，其返回值为任务结果。"""
+        job = Job(uuid.uuid4().hex[:12], label)
+
+        def run():
+            started = time.perf_counter()
+            try:
+                # 排队期间已被取消的任务不再运行
+                job.progress.check()
+                result = fn(job)
+                logger.info(f"任务 {job.id}（{label}）完成，用时 {time.perf_counter() - started:.2f} 秒。")
+                return result
+            except JobCancelled:
+                logger.info(f"任务 {job.id}（{label}）已取消。")
+                raise
+            except Exception as e:
+                logger.error(f"任务 {job.id}（{label}）失败: {e}", exc_info=True)
+                raise
+            finally:
+                job.finished_at = time.time()
+
+        with self._lock:
+            self._prune()
+            job.future = self._executor.submit(run)
+            self._jobs[job.id] = job
+        logger.info(f"已提交任务 {job.id}（{label}）。")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Job]:
+        """所有登记中的任务，按提交顺序排列。"""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> bool:
+        """请求取消任务：排队中的任务直接取消，运行中的任务在下一个检查点停止。任务不存在时返回 False。"""
+        job = self.get(job_id)
+        if job is None:
+            return False
+        job.progress.cancel()
+        job.future.cancel()
+        return True
+
+    def _prune(self):
+        """只保留最近结束的 history 个任务（调用方需持有锁）。"""
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished),
+            key=lambda job: job.finished_at or job.submitted_at
+        )
+        for job in finished[:max(len(finished) - self.history, 0)]:
+            del self._jobs[job.id]
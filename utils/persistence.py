@@ -1,63 +1,182 @@
+import hashlib
+import json
+import pickle
+import threading
+from datetime import datetime
 import pandas as pd
 import streamlit as st
-from pathlib import Path
-import pickle
-from config import setup_logging
+from config import setup_logging, CACHE_DIR, PERSIST_MAX_VERSIONS
+from utils.arrow_io import read_dataframe, write_feather
 
 logger = setup_logging()
 
-# 定义一个缓存目录来存放持久化文件
-CACHE_DIR = Path(".cache")
+# 确保缓存目录存在，用来存放持久化文件
 CACHE_DIR.mkdir(exist_ok=True)
+STORE_DIR = CACHE_DIR / "store"
+_LOCK = threading.Lock()
+
 
 class PersistenceManager:
     """
-    负责处理数据持久化，将DataFrame保存到本地文件或从本地文件加载。
+    负责处理数据持久化，将DataFrame按版本保存为 Feather(Arrow) 文件，或从中加载。
+    每个数据集一个目录：manifest.json 记录各版本的保存时间、原始文件名、内容指纹与列结构，
+    以及当前使用的版本；超出 PERSIST_MAX_VERSIONS 的旧版本会被删除。
     """
 
     @staticmethod
-    def save_dataframe(df: pd.DataFrame, filename: str):
+    def _dataset_dir(name: str):
+        return STORE_DIR / name
+
+    @staticmethod
+    def _read_manifest(name: str) -> dict:
+        path = PersistenceManager._dataset_dir(name) / "manifest.json"
+        if not path.exists():
+            return {"current": None, "versions": []}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_manifest(name: str, manifest: dict):
+        directory = PersistenceManager._dataset_dir(name)
+        temp_path = directory / "manifest.json.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        # 先写临时文件再替换，避免读到写了一半的清单
+        temp_path.replace(directory / "manifest.json")
+
+    @staticmethod
+    def save_dataframe(df: pd.DataFrame, name: str, source_name: str = None, content_hash: str = None):
         """
-        将DataFrame使用pickle格式保存到缓存目录。
+        将DataFrame保存为数据集的一个新版本，并设为当前版本。
 
         Args:
             df: 需要保存的DataFrame。
-            filename: 保存的文件名 (例如 'map_df.pkl')。
+            name: 数据集名称 (例如 'map_df')。
+            source_name: 原始文件名，记录在清单中。
+            content_hash: 原始文件内容的指纹；与当前版本相同时不再保存新版本。
+
+        Returns:
+            当前版本号；保存失败时返回 None。
         """
         if not isinstance(df, pd.DataFrame):
             logger.error("保存失败：提供的数据不是一个DataFrame。")
-            return
+            return None
 
-        file_path = CACHE_DIR / filename
         try:
-            with open(file_path, "wb") as f:
-                pickle.dump(df, f)
-            logger.info(f"DataFrame已成功保存到 {file_path}")
+            with _LOCK:
+                manifest = PersistenceManager._read_manifest(name)
+                current = PersistenceManager._find_version(manifest, manifest["current"])
+                if content_hash and current and current["content_hash"] == content_hash:
+                    return current["version"]
+
+                directory = PersistenceManager._dataset_dir(name)
+                directory.mkdir(parents=True, exist_ok=True)
+                version = max((entry["version"] for entry in manifest["versions"]), default=0) + 1
+                file_path = directory / f"v{version}.feather"
+                write_feather(df, file_path)
+                if not content_hash:
+                    content_hash = hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+                manifest["versions"].append({
+                    "version": version,
+                    "file": file_path.name,
+                    "saved_at": datetime.now().isoformat(timespec="seconds"),
+                    "source_name": source_name,
+                    "content_hash": content_hash,
+                    "rows": int(df.shape[0]),
+                    "schema": {str(col): str(dtype) for col, dtype in df.dtypes.items()},
+                })
+                manifest["current"] = version
+                PersistenceManager._evict(name, manifest)
+                PersistenceManager._write_manifest(name, manifest)
+            logger.info(f"DataFrame已保存为 {name} 的版本 v{version}")
+            return version
         except Exception as e:
-            logger.error(f"保存DataFrame到 {file_path} 时出错: {e}")
+            logger.error(f"保存DataFrame {name} 时出错: {e}")
             st.warning(f"无法保存映射表历史记录: {e}")
+            return None
 
     @staticmethod
-    def load_dataframe(filename: str) -> pd.DataFrame | None:
+    def _find_version(manifest: dict, version):
+        return next((entry for entry in manifest["versions"] if entry["version"] == version), None)
+
+    @staticmethod
+    def _evict(name: str, manifest: dict):
+        """删除超出保留数量的最旧版本（当前版本不会被删除）。"""
+        while len(manifest["versions"]) > PERSIST_MAX_VERSIONS:
+            oldest = next(entry for entry in manifest["versions"] if entry["version"] != manifest["current"])
+            manifest["versions"].remove(oldest)
+            try:
+                (PersistenceManager._dataset_dir(name) / oldest["file"]).unlink()
+            except OSError as e:
+                logger.warning(f"删除历史版本 {oldest['file']} 失败: {e}")
+
+    @staticmethod
+    def list_versions(name: str) -> list:
+        """返回数据集的版本清单（最新在前），每项包含版本号、保存时间、原始文件名、内容指纹、行数与列结构。"""
+        manifest = PersistenceManager._read_manifest(name)
+        return list(reversed(manifest["versions"]))
+
+    @staticmethod
+    def current_version(name: str):
+        """返回数据集当前使用的版本号，没有任何版本时返回 None。"""
+        return PersistenceManager._read_manifest(name)["current"]
+
+    @staticmethod
+    def set_current_version(name: str, version: int) -> bool:
+        """把数据集的当前版本切换为指定版本（用于回滚），版本不存在时返回 False。"""
+        with _LOCK:
+            manifest = PersistenceManager._read_manifest(name)
+            if PersistenceManager._find_version(manifest, version) is None:
+                return False
+            manifest["current"] = version
+            PersistenceManager._write_manifest(name, manifest)
+        logger.info(f"{name} 已切换到版本 v{version}")
+        return True
+
+    @staticmethod
+    def load_dataframe(name: str, version: int = None) -> pd.DataFrame | None:
         """
-        从缓存目录加载一个pickle格式的DataFrame。
+        加载数据集的指定版本（默认当前版本），整份读入为 DataFrame。
 
         Args:
-            filename: 要加载的文件名。
+            name: 数据集名称。
+            version: 版本号，None 表示当前版本。
 
         Returns:
-            加载的DataFrame，如果文件不存在或加载失败则返回None。
+            加载的DataFrame，如果没有可用版本或加载失败则返回None。
         """
-        file_path = CACHE_DIR / filename
-        if not file_path.exists():
+        PersistenceManager._migrate_pickle(name)
+        manifest = PersistenceManager._read_manifest(name)
+        entry = PersistenceManager._find_version(manifest, manifest["current"] if version is None else version)
+        if entry is None:
             return None
 
+        file_path = PersistenceManager._dataset_dir(name) / entry["file"]
         try:
-            with open(file_path, "rb") as f:
-                df = pickle.load(f)
+            df = read_dataframe(file_path)
+            # 清单中已有内容指纹，映射计划（MappingPlan.fingerprint）直接以它为缓存键
+            df.attrs['content_hash'] = entry["content_hash"]
+            df.attrs['content_shape'] = df.shape
             logger.info(f"DataFrame已成功从 {file_path} 加载")
             return df
         except Exception as e:
             logger.error(f"从 {file_path} 加载DataFrame时出错: {e}")
             st.warning(f"加载历史映射表失败，文件可能已损坏。请重新上传。")
             return None
+
+    @staticmethod
+    def _migrate_pickle(name: str):
+        """把旧版本保存的 <name>.pkl 迁移为版本化存储中的一个版本，迁移后删除旧文件。"""
+        legacy_path = CACHE_DIR / f"{name}.pkl"
+        if not legacy_path.exists() or PersistenceManager._read_manifest(name)["versions"]:
+            return
+        try:
+            # 旧文件由本程序写入，仅在迁移时读取一次
+            with open(legacy_path, "rb") as f:
+                df = pickle.load(f)
+            if PersistenceManager.save_dataframe(df, name, source_name=legacy_path.name) is not None:
+                legacy_path.unlink()
+                logger.info(f"已将 {legacy_path} 迁移为版本化存储。")
+        except Exception as e:
+            logger.error(f"迁移 {legacy_path} 时出错: {e}")
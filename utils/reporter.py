@@ -0,0 +1,79 @@
+"""
+处理流程中面向使用者的提示信息出口。
+策略与数据库处理器只调用 Reporter 的接口，不直接依赖界面：
+Streamlit 应用使用 ui.reporter.StreamlitReporter，命令行批处理直接使用本模块的 Reporter。
+"""
+
+from queue import Empty, Queue
+from typing import Callable, List, Tuple
+from config import setup_logging
+
+logger = setup_logging()
+
+
+class Reporter:
+    """把提示信息写入日志，并按顺序记录下来（供批处理写入运行摘要）。"""
+
+    def __init__(self):
+        # [(级别, 信息)]
+        self.messages: List[Tuple[str, str]] = []
+
+    def _record(self, level: str, message: str):
+        self.messages.append((level, message))
+
+    def info(self, message: str):
+        logger.info(message)
+        self._record("info", message)
+
+    def warning(self, message: str):
+        logger.warning(message)
+        self._record("warning", message)
+
+    def error(self, message: str):
+        logger.error(message)
+        self._record("error", message)
+
+    def status(self, label: str, state: str = "running"):
+        """流程进度；默认只写日志，不记录。"""
+        logger.info(label)
+
+
+class QueuedReporter(Reporter):
+    """
+    供工作线程使用：提示信息与进度先放入队列，由调用线程通过 drain() 转发
+    （Streamlit 页面只能在脚本线程中更新）。
+    """
+
+    def __init__(self, queue: Queue):
+        super().__init__()
+        self._queue = queue
+
+    def info(self, message: str):
+        self._queue.put(("info", message, None))
+
+    def warning(self, message: str):
+        self._queue.put(("warning", message, None))
+
+    def error(self, message: str):
+        self._queue.put(("error", message, None))
+
+    def status(self, label: str, state: str = "running"):
+        self._queue.put(("status", label, state))
+
+    @staticmethod
+    def drain(queue: Queue, reporter: Reporter, status_updater: Callable, timeout: float = None) -> int:
+        """
+        把队列中的信息转发给 reporter / status_updater，返回转发的条数。
+        timeout 不为 None 时，队列为空则最多等待 timeout 秒再返回。
+        """
+        forwarded = 0
+        while True:
+            try:
+                level, message, state = queue.get(timeout=timeout) if timeout is not None and not forwarded else queue.get_nowait()
+            except Empty:
+                return forwarded
+            if level == "status":
+                status_updater(label=message, state=state)
+            else:
+                getattr(reporter, level)(message)
+            forwarded += 1
@@ -0,0 +1,54 @@
+"""
+静态资源缓存：SQL 模板、映射文件等磁盘文件只在内容变化后才重新读取。
+缓存为模块级对象，Streamlit 的每次重跑和每个会话共享同一份；
+以文件的修改时间和大小判断是否失效。
+"""
+
+import threading
+from pathlib import Path
+from typing import Callable, TypeVar
+from config import setup_logging
+
+logger = setup_logging()
+
+T = TypeVar("T")
+
+# {(文件路径, 读取函数名): (修改时间, 文件大小, 读取结果)}
+_ENTRIES = {}
+_LOCK = threading.Lock()
+
+
+def load_cached(path: Path, loader: Callable[[Path], T]) -> T:
+    """
+    返回 loader(path) 的结果；文件修改时间与大小未变时直接复用上次的结果。
+    返回的是共享对象，调用方如需修改（例如 DataFrame）应先复制。
+
+    Raises:
+        FileNotFoundError: 文件不存在。
+    """
+    path = Path(path)
+    stat = path.stat()
+    key = (str(path.resolve()), getattr(loader, '__qualname__', repr(loader)))
+    with _LOCK:
+        entry = _ENTRIES.get(key)
+    if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+        return entry[2]
+
+    value = loader(path)
+    with _LOCK:
+        _ENTRIES[key] = (stat.st_mtime_ns, stat.st_size, value)
+    if entry is not None:
+        logger.info(f"文件 {path} 已更新，已重新读取。")
+    return value
+
+
+def read_text(path: Path) -> str:
+    """读取 UTF-8 文本文件。"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def clear():
+    """清空所有静态资源缓存。"""
+    with _LOCK:
+        _ENTRIES.clear()